@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Headless batch runner for the CORD Optimisation scripts.
+
+Runs the scripts without any folder dialogs or prompts from a JSON job spec,
+so they can be scheduled on servers without a display:
+
+    {"workers": 4,
+     "jobs": [{"tool": "redundancyReport",
+               "input": "D:/CORD/INPUT", "output": "D:/CORD/OUTPUT"},
+              {"name": "Bluebook impacts", "tool": "ImpactTracer",
+               "input": "D:/CORD/INPUT", "processing": "D:/CORD/PROC",
+               "output": "D:/CORD/OUTPUT",
+               "options": {"queryFile": "queries.csv", "taskAct": "BB"}}]}
+
+    python CORDbatch.py jobs.json [--workers 4]
+
+Each job runs in its own Python process with its own working folder inside
+the batch folder, so the scripts' module globals can't affect each other.
+At most workers jobs run at once, each given an even share of the cores for
+its own worker pools. Jobs sharing a PROCESSING folder run one after another
+so they can't clear each other's results. Relative paths in the spec are
+taken from the spec's folder. The output of each job is logged to the job's
+working folder and a Batch Summary.csv of every job is written to the batch
+folder.
+
+Options are passed to the script's runTask, eg topLevelTasks for
+renumberObjects (a list, or a dict of lists by Stat Act) or queryFile and
+taskAct for ImpactTracer.
+"""
+
+import os, sys, json, time, datetime, subprocess, argparse
+import pandas as pd
+import CORDtools as ct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+def readJobs(specFile):
+    """Reads a JSON job spec, returning its jobs with their paths made
+    absolute and the number of workers it asks for (None if it doesn't).
+    """
+    specDir = os.path.dirname(os.path.abspath(specFile))
+    with open(specFile) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+    jobs = []
+    for n, job in enumerate(spec.get('jobs', [])):
+        job = dict(job)
+        job.setdefault('name', str(n+1) + ' ' + str(job.get('tool')))
+        job['options'] = dict(job.get('options', {}))
+        for key in FOLDER_ARGS.get(job.get('tool'), {}):
+            if key in job:
+                job[key] = os.path.join(specDir, job[key])
+        for key in PATH_OPTIONS:
+            if key in job['options']:
+                job['options'][key] = os.path.join(specDir,
+                                                   job['options'][key])
+        jobs.append(job)
+    return jobs, spec.get('workers')
+
+def checkJob(job):
+    """Returns why job can't be run headless, or None if it can.
+    """
+    tool = job.get('tool')
+    if tool not in FOLDER_ARGS:
+        return 'Unknown tool "' + str(tool) + '".'
+    for key in FOLDER_ARGS[tool]:
+        if key not in job:
+            return tool + ' jobs need a "' + key + '" folder.'
+        if key == 'input' and not os.path.isdir(job[key]):
+            return 'INPUT folder "' + job[key] + '" does not exist.'
+    for opt in REQUIRED_OPTIONS.get(tool, []):
+        if opt not in job['options']:
+            return tool + ' jobs need the option "' + opt + '" to run ' +\
+                   'without prompts.'
+    return None
+
+def taskArgs(job):
+    """Returns the keyword arguments job passes to its tool's runTask.
+    """
+    kwargs = dict(job['options'])
+    for key, arg in FOLDER_ARGS[job['tool']].items():
+        kwargs[arg] = job[key]
+    return kwargs
+
+def runJob(job, workDir):
+    """Runs job in a new Python process working in workDir, logging its
+    output there. Returns the job's return code and the seconds it took.
+    """
+    os.makedirs(workDir, exist_ok=True)
+    for key in FOLDER_ARGS[job['tool']]:
+        if key != 'input':
+            os.makedirs(job[key], exist_ok=True)
+    jobFile = os.path.join(workDir, 'job.json')
+    with open(jobFile, 'w') as f:
+        json.dump(job, f, indent=1)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    start = time.time()
+    with open(os.path.join(workDir, 'job.log'), 'w') as log:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__),
+                               '--job', jobFile], cwd=workDir, env=env,
+                              stdin=subprocess.DEVNULL, stdout=log,
+                              stderr=subprocess.STDOUT)
+    return proc.returncode, time.time() - start
+
+def runJobs(group):
+    """Runs the (job, working folder) pairs of group one after another.
+    Returns the status, seconds taken and detail of each job.
+    """
+    results = []
+    for job, workDir in group:
+        try:
+            code, secs = runJob(job, workDir)
+            status = 'Done' if code == 0 else 'Failed'
+            detail = '' if code == 0 else 'Exit code ' + str(code)
+        except Exception as e:
+            status, secs, detail = 'Failed', 0.0, str(e)
+        if status == 'Done':
+            print(job['name'], 'finished in', round(secs, 1), 'seconds.')
+        else:
+            ct.error(job['name'] + ' failed, see ' +
+                     os.path.join(workDir, 'job.log'))
+        results.append((status, secs, detail))
+    return results
+
+def runBatch(jobs, workers=None, batchFol=None):
+    """Runs jobs over a queue of at most workers at once (every core if
+    None), each in its own working folder inside batchFol. Jobs sharing a
+    PROCESSING folder are queued together and run one after another. Returns
+    a dataframe summarising how each job went.
+    """
+    if batchFol is None:
+        batchFol = os.path.join(os.getcwd(), 'CORD Batch ' +
+                   datetime.datetime.now().strftime("%d-%m-%Y (%H;%M;%S)"))
+    os.makedirs(batchFol, exist_ok=True)
+    cores = os.cpu_count() or 1
+    workers = workers or cores
+    rows = []
+    groups = {}
+    for n, job in enumerate(jobs):
+        workDir = os.path.join(batchFol, 'Job ' + str(n+1))
+        problem = checkJob(job)
+        if problem is not None:
+            ct.error(job['name'] + ': ' + problem + ' Skipping...')
+            rows.append([job['name'], job.get('tool'), 'Skipped', 0.0,
+                         problem, workDir])
+            continue
+        key = n
+        if 'processing' in FOLDER_ARGS[job['tool']]:
+            key = os.path.normcase(os.path.abspath(job['processing']))
+        groups.setdefault(key, []).append((job, workDir))
+    #Split the cores between the jobs running at once
+    cpus = max(1, cores // max(1, min(workers, len(groups))))
+    queued = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for group in groups.values():
+            group = [(dict(job, cpus=cpus), workDir)
+                     for job, workDir in group]
+            if len(group) > 1:
+                print('Queued', ', '.join(job['name'] for job, w in group),
+                      'to run one after another as they share a '+
+                      'PROCESSING folder...')
+            else:
+                print('Queued', group[0][0]['name'] + '...')
+            queued[pool.submit(runJobs, group)] = group
+        for future in as_completed(queued):
+            for (job, workDir), (status, secs, detail) in \
+                zip(queued[future], future.result()):
+                rows.append([job['name'], job['tool'], status,
+                             round(secs, 2), detail, workDir])
+    summaryDf = pd.DataFrame(rows, columns=['Job', 'Tool', 'Status',
+                                            'Seconds', 'Detail',
+                                            'Working Folder'])
+    summaryDf.to_csv(os.path.join(batchFol, 'Batch Summary.csv'),
+                     index=False)
+    return summaryDf
+
+def execJob(jobFile):
+    """Runs the job saved in jobFile in this process. Used by runJob in the
+    job's own process.
+    """
+    with open(jobFile) as f:
+        job = json.load(f)
+    print('Running', job['name'], 'with', job['tool'] + '...')
+    #Keep the job's worker pools to its share of the cores
+    ct.UNZIP_WORKERS = ct.LOAD_WORKERS = job.get('cpus')
+    tool = __import__(job['tool'])
+    if hasattr(tool, 'INGEST_WORKERS'):
+        tool.INGEST_WORKERS = job.get('cpus')
+    tool.runTask(**taskArgs(job))
+    ct.done()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs CORD Optimisation '+
+                                     'scripts headless from a JSON job spec.')
+    parser.add_argument('spec', nargs='?', help='JSON job spec file')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='most jobs to run at once')
+    parser.add_argument('--batch-folder', default=None,
+                        help='folder to hold the jobs\' working folders')
+    parser.add_argument('--job', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.job is not None:
+        execJob(args.job)
+        return 0
+    if args.spec is None:
+        parser.error('a job spec is needed')
+    jobs, workers = readJobs(args.spec)
+    if args.workers is not None:
+        workers = args.workers
+    summaryDf = runBatch(jobs, workers, args.batch_folder)
+    print(summaryDf[['Job', 'Status', 'Seconds']].to_string(index=False))
+    return 0 if (summaryDf['Status'] == 'Done').all() else 1
+
+#Spec folders of each tool and the runTask arguments they're passed as
+FOLDER_ARGS = {'redundancyReport': {'input': 'inp', 'output': 'out'},
+               'dependenciesReport': {'input': 'inp', 'output': 'out'},
+               'renumberObjects': {'input': 'inp', 'output': 'out'},
+               'compareModes': {'input': 'inp', 'output': 'out'},
+               'compareDatasets': {'input': 'inp', 'output': 'out'},
+               'ImpactTracer': {'input': 'inp', 'processing': 'proc',
+                                'output': 'out'}}
+#Options that the tools would otherwise prompt for
+REQUIRED_OPTIONS = {'renumberObjects': ['topLevelTasks'],
+                    'ImpactTracer': ['queryFile']}
+#Options that are filepaths, relative to the spec's folder
+PATH_OPTIONS = ['queryFile']
+
+if __name__ == '__main__':
+    sys.exit(main())
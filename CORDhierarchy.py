@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Parent-child hierarchies for CORD classifications.
+
+Reads the PCLnk reports of a Config Report into an adjacency structure and
+works out the descendant and ancestor closures of every code once. Closed
+hierarchies are saved to a cache folder keyed by a hash of the PCLnk file, so
+each version of a classification's hierarchy only has to be unpacked once.
+"""
+
+import os, pickle
+import CORDtools as ct
+
+class Hierarchy():
+    """Parent-child links for a single classification.
+
+    children and parents map each code to the list of codes directly below or
+    above it. The links are also held in a set so duplicates are found
+    without scanning a code's children. Closures are memoised the first time
+    they are asked for, or all at once by close().
+    """
+    def __init__(self, clas):
+        self.clas = clas
+        self.children = {}
+        self.parents = {}
+        self._links = set()
+        self._desc = {}
+        self._anc = {}
+
+    def __getstate__(self):
+        #The link set is rebuilt from children when needed, so isn't cached
+        state = dict(self.__dict__)
+        state.pop('_links', None)
+        return state
+
+    def links(self):
+        """Returns the set of (parent, child) links in the hierarchy.
+        """
+        if getattr(self, '_links', None) is None:
+            self._links = {(parent, child) for parent, kids in
+                           self.children.items() for child in kids}
+        return self._links
+
+    def addLink(self, parent, child):
+        """Adds a single parent-child link, ignoring duplicates.
+        """
+        links = self.links()
+        if (parent, child) not in links:
+            links.add((parent, child))
+            self.children.setdefault(parent, []).append(child)
+            self.parents.setdefault(child, []).append(parent)
+            self._desc = {}
+            self._anc = {}
+
+    def addLinks(self, parents, children):
+        """Adds the parent-child links from two equal length sequences.
+        """
+        for parent, child in zip(parents, children):
+            self.addLink(parent, child)
+
+    def isParent(self, code):
+        """Returns True if code has any children in this hierarchy.
+        """
+        return code in self.children
+
+    def _closure(self, code, links, memo, active):
+        if code in memo:
+            return memo[code]
+        #Guard against badly defined hierarchies that loop back on themselves
+        active.add(code)
+        direct = links.get(code, [])
+        closure = list(direct)
+        for item in direct:
+            if item in active: continue
+            closure.extend(self._closure(item, links, memo, active))
+        active.discard(code)
+        memo[code] = tuple(dict.fromkeys(closure))
+        return memo[code]
+
+    def descendants(self, code):
+        """Returns every code below code as a tuple, children first.
+        """
+        return self._closure(code, self.children, self._desc, set())
+
+    def ancestors(self, code):
+        """Returns every code above code as a tuple, parents first.
+        """
+        return self._closure(code, self.parents, self._anc, set())
+
+    def close(self):
+        """Computes the descendant and ancestor closures of every code.
+        """
+        for code in self.children:
+            self.descendants(code)
+        for code in self.parents:
+            self.ancestors(code)
+        return self
+
+    def merge(self, other):
+        """Adds the links of another Hierarchy of the same classification.
+        """
+        for parent, kids in other.children.items():
+            for child in kids:
+                self.addLink(parent, child)
+        return self
+
+def readPCLinks(file, clas=None):
+    """Reads a PCLnk report (a filepath or zip member, see
+    CORDtools.openReport) and returns its classification name alongside a
+    Hierarchy of its links. If clas is given it is used instead of the name in
+    the file's metadata.
+    """
+    meta, pcTmp = ct.readReportTable(file, converters={
+                                     'Parent Code': lambda x: str(x),
+                                     'Child Code': lambda x: str(x)})
+    if clas is None:
+        clas = meta['Classification']
+        if clas == 'ZZZZ_SIC 2007 with EUROSTAT inds':
+            clas = 'Industry'
+    hierarchy = Hierarchy(clas)
+    hierarchy.addLinks(pcTmp['Parent Code'].tolist(),
+                       pcTmp['Child Code'].tolist())
+    return clas, hierarchy
+
+def loadPCLinks(file, clas=None, cacheFol=None):
+    """Returns the classification name and closed Hierarchy of a PCLnk report.
+
+    If cacheFol is given, the closed Hierarchy is loaded from the cache when
+    this version of the file has been seen before, otherwise it is built and
+    saved there for next time.
+    """
+    if cacheFol is None:
+        return readPCLinks(file, clas)
+    cacheFile = os.path.join(cacheFol, 'PCLnk_' + ct.reportHash(file) +
+                             '_' + str(clas) + '.pkl')
+    if os.path.exists(cacheFile):
+        try:
+            with open(cacheFile, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            ct.error('Unable to load cached hierarchy, rebuilding. ' + str(e),
+                     warning=True)
+    clas, hierarchy = readPCLinks(file, clas)
+    hierarchy.close()
+    ct.savePickle((clas, hierarchy), cacheFile)
+    return clas, hierarchy
+
+def addHierarchy(hierarchies, clas, hierarchy):
+    """Adds hierarchy to the dict hierarchies under clas, merging it with any
+    hierarchy already held for that classification.
+    """
+    if clas in hierarchies:
+        hierarchies[clas].merge(hierarchy).close()
+    else:
+        hierarchies[clas] = hierarchy
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Classification mappings for CORD indirect dimension mappings.
+
+Each MpItm report of a Config Report is loaded into a ClassMapping, which
+holds the many-to-many links between source and target codes as forward and
+reverse dicts so whole sets of codes can be mapped in one call.
+"""
+
+import CORDtools as ct
+
+class ClassMapping():
+    """Many-to-many mapping between the codes of two classifications.
+
+    forward maps each source code to the list of target codes it feeds and
+    reverse maps each target code to the list of source codes feeding it.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.forward = {}
+        self.reverse = {}
+
+    def addPair(self, src, targ):
+        """Adds a single source to target code link, ignoring duplicates.
+        """
+        targs = self.forward.setdefault(src, [])
+        if targ not in targs:
+            targs.append(targ)
+            self.reverse.setdefault(targ, []).append(src)
+
+    def addPairs(self, srcs, targs):
+        """Adds the source to target links from two equal length sequences.
+        """
+        for src, targ in zip(srcs, targs):
+            self.addPair(src, targ)
+
+    def sources(self):
+        """Returns every source code in the mapping.
+        """
+        return list(self.forward)
+
+    def targets(self):
+        """Returns every target code in the mapping.
+        """
+        return list(self.reverse)
+
+    def mapCodes(self, codes):
+        """Returns the target codes fed by any of the source codes in codes,
+        in the order they were first mapped.
+        """
+        mapped = {}
+        for code in codes:
+            for targ in self.forward.get(code, []):
+                mapped[targ] = None
+        return list(mapped)
+
+    def unmapCodes(self, codes):
+        """Returns the source codes that feed any of the target codes in
+        codes, in the order they were first mapped.
+        """
+        mapped = {}
+        for code in codes:
+            for src in self.reverse.get(code, []):
+                mapped[src] = None
+        return list(mapped)
+
+def readMapping(file):
+    """Reads a MpItm report and returns it as a ClassMapping named after the
+    mapping in the file's metadata.
+    """
+    meta, mapDf = ct.readReportTable(file, converters={
+                                     'Source Code': lambda x: str(x),
+                                     'Target Code': lambda x: str(x)})
+    name = meta['Mapping']
+    mapping = ClassMapping(name)
+    mapping.addPairs(mapDf['Source Code'].str.strip().tolist(),
+                     mapDf['Target Code'].str.strip().tolist())
+    return mapping
@@ -3,10 +3,14 @@
 Common functions used across CORD Optimisation scripts.
 """
 
-import sys, os, glob, datetime
-import tkinter as tk, pandas as pd
+import sys, os, re, io, glob, datetime, time, hashlib, json, shutil, csv
+import pickle, threading, socket
+import pandas as pd
+from collections import namedtuple
+from contextlib import contextmanager
 from zipfile import ZipFile
-from tkinter.filedialog import askdirectory
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
     
 def error(msg, warning=False):
     """Prints an error message in red, or if warning=True, a warning message
@@ -24,6 +28,9 @@ def setupFilepaths(inp=True, out=True, proc=False):
     """Sets up the INPUT and OUTPUT filepaths by asking the user to select the
     folders. A PROCESSING file can also be set up by setting proc=True.
     """
+    #tkinter is only needed for the dialogs, so isn't imported by headless runs
+    import tkinter as tk
+    from tkinter.filedialog import askdirectory
     root = tk.Tk()
     if inp:
         inpFol = askdirectory(title="Choose an INPUT folder")
@@ -34,13 +41,13 @@ def setupFilepaths(inp=True, out=True, proc=False):
     root.destroy()
     if inp and inpFol == '':
         error('An INPUT folder must be selected.')
-        sys.exit()
+        sys.exit(1)
     if proc and procFol == '':
         error('A PROCCESSING folder must be selected.')
-        sys.exit()
+        sys.exit(1)
     if out and outFol == '':
         error('An OUTPUT folder must be selected.')
-        sys.exit()
+        sys.exit(1)
     if proc:
         return (inpFol, procFol, outFol)
     else:
@@ -67,67 +74,736 @@ def done():
     sys.stdout.write("\033[0;0m")
     
 def unzipFiles(file):
-    """Unzips the specified file.
+    """Unzips the specified file to a folder of the same name beside it and
+    returns the folder's path.
     """
     fileTitle = os.path.splitext(file)[0]
-    print('Unzipping', fileTitle, '...')
+    print('Unzipping', os.path.basename(fileTitle), '...')
     with ZipFile(file, 'r') as zipObj:
         zipObj.extractall(fileTitle)
+    return fileTitle
+
+def folderFiles(fol, pattern='*'):
+    """Returns the sorted paths of the files in the folder fol matching the
+    glob pattern, without changing the working directory.
+    """
+    return sorted(glob.glob(os.path.join(glob.escape(fol), pattern)))
         
-def splitCordString(s, clas=True):
-    """Split up a CORD Output string (in format {*** = ***}) into individual
-    strings contained in list splitString. Returns splitString.
-    """
-    if clas:
-        s = s.replace('{classification', ' classification')
-    s = s.replace('} ','')
-    s = s.replace('}','')
-    s = s.replace("'", '')
-    s = s.replace(' {', '{')
-    splitString = s.split('{')
-    while '' in splitString:
-        splitString.remove('')
-    for i, ss in enumerate(splitString):
-        splitString[i] = ss.strip()
-    return splitString
+CordItem = namedtuple('CordItem', ['key', 'op', 'value', 'mapType',
+                                   'mapping'])
+
+CORD_ITEMS = re.compile(r'\{((?:[^{}]|\{[^{}]*\})*)\}')
+CORD_NESTED = re.compile(r'\{([^{}]*)\}')
+CORD_PARTS = re.compile(r'^\s*(.*?)\s*(?:(->)\s*\((\w+)\)|(=))\s*(.*?)\s*$',
+                        re.S)
+
+def parseCordItem(text):
+    """Parses the text of a single CORD item into a CordItem, or returns None
+    if it isn't a key = value or key -> (type) value item.
+    """
+    nested = CORD_NESTED.findall(text)
+    match = CORD_PARTS.match(CORD_NESTED.sub('', text).replace("'", ''))
+    if match is None:
+        return None
+    key, arrow, mapType, equals, value = match.groups()
+    mapping = None
+    for inner in nested:
+        innerItem = parseCordItem(inner)
+        if innerItem is not None and innerItem.key == 'classification mapping':
+            mapping = innerItem.value
+    return CordItem(key, arrow or equals, value, mapType, mapping)
+
+@lru_cache(maxsize=65536)
+def parseCordString(s):
+    """Parses a CORD Output string (in format {*** = ***}) into a tuple of
+    CordItems. Each item has a key, an op of '=' or '->', a value and, for
+    dimension mappings, the mapping type (Direct, Indirect or Unmapped) and
+    the classification mapping of Indirect mappings. A string without braces
+    is parsed as a single item.
+    """
+    if not isinstance(s, str):
+        return ()
+    items = []
+    for text in CORD_ITEMS.findall(s) if '{' in s else [s]:
+        item = parseCordItem(text)
+        if item is None:
+            continue
+        #The classification mapping of an Indirect mapping may follow it as
+        #its own item rather than being nested inside it
+        if item.key == 'classification mapping' and items != [] \
+        and items[-1].op == '->':
+            items[-1] = items[-1]._replace(mapping=item.value)
+            continue
+        items.append(item)
+    return tuple(items)
+
+def parseCordSeries(series):
+    """Parses every CORD string in a Series, parsing each distinct string
+    only once. Returns a Series of tuples of CordItems.
+    """
+    codes, uniques = pd.factorize(series)
+    parsed = [parseCordString(s) for s in uniques] + [()]
+    return pd.Series([parsed[c] for c in codes], index=series.index,
+                     dtype=object)
+
+FORMULA_TOKENS = re.compile(r'([^\s+\-*/,():]+)|([+\-*/:])|(\()|(\))|(,)')
+FORMULA_TYPES = ['NAME', 'OP', 'LPAREN', 'RPAREN', 'COMMA']
+
+def tokeniseFormula(formula):
+    """Splits a CORD formula string into a list of (type, text) tokens in a
+    single pass. Types are NUMBER, PARAM ($ prefixed parameters), FUNC (names
+    followed by an opening bracket), NAME (classification items), OP, LPAREN,
+    RPAREN and COMMA.
+    """
+    tokens = []
+    for match in FORMULA_TOKENS.finditer(formula):
+        tokType = FORMULA_TYPES[match.lastindex-1]
+        text = match.group(match.lastindex)
+        if tokType == 'NAME':
+            if text[0] == '$':
+                tokType = 'PARAM'
+            else:
+                try:
+                    float(text)
+                    tokType = 'NUMBER'
+                except ValueError:
+                    pass
+        if tokType == 'LPAREN' and tokens != [] and tokens[-1][0] == 'NAME':
+            tokens[-1] = ('FUNC', tokens[-1][1])
+        tokens.append((tokType, text))
+    return tokens
+
+@lru_cache(maxsize=None)
+def formulaItems(formula):
+    """Returns a frozenset of the classification items referenced in a CORD
+    formula string.
+    """
+    return frozenset(text for tokType, text in tokeniseFormula(formula)
+                     if tokType == 'NAME')
+
+@lru_cache(maxsize=None)
+def formulaParams(formula):
+    """Returns a frozenset of the parameter names (without the $) referenced
+    in a CORD formula string.
+    """
+    return frozenset(text[1:] for tokType, text in tokeniseFormula(formula)
+                     if tokType == 'PARAM')
 
 def createOutFolder(outFol):
-    """Changes directories to the output folder setting one up if it doesn't 
-    already exist. Returns the created folder path.
+    """Sets up a folder of the date and time inside the output folder outFol
+    if it doesn't already exist. Returns the created folder path.
     """
-    returnPath = os.getcwd()
-    os.chdir(outFol)
     fol = datetime.datetime.now().strftime("%d-%m-%Y (%H;%M;%S)")
-    try:
-        os.chdir(fol)
-    except:
-        os.mkdir(fol)
-        os.chdir(fol)
-    outFolder = os.getcwd()
-    os.chdir(returnPath)
+    outFolder = os.path.abspath(os.path.join(outFol, fol))
+    os.makedirs(outFolder, exist_ok=True)
     return outFolder
     
-def unzipConfigReports(fol):
+UNZIP_WORKERS = None
+
+def configReportMeta(fileTitle):
+    """Returns the meta data row of a Config Report from its file title.
+    """
+    splitTitle = fileTitle.split('_Config_Report_')
+    return {'Config Report': fileTitle,
+            'Statistical Activity': splitTitle[0],
+            'Mode': splitTitle[1].split('_')[0],
+            'Date': ' '.join(splitTitle[1].split('_')[1:])}
+
+def extractReport(file, fileTitle):
+    """Extracts the zip file to the folder fileTitle, replacing any older
+    extraction. Returns fileTitle.
+    """
+    print('Unzipping', os.path.basename(fileTitle), '...')
+    if os.path.isdir(fileTitle):
+        shutil.rmtree(fileTitle)
+    with ZipFile(file, 'r') as zipObj:
+        zipObj.extractall(fileTitle)
+    return fileTitle
+
+def unzipConfigReports(fol, workers=None):
     """Unzips all Configuration Reports in the specified folder. Adds the
     meta data to a pandas DataFrame configReports which is returned.
+
+    A manifest of each zip's hash is kept in the folder's cache, so zips
+    that have already been extracted and haven't changed are skipped. The
+    rest are extracted over a pool of worker threads, while holding the
+    folder's unzip lock.
     """
-    os.chdir(fol)
-    configReports = pd.DataFrame(columns=['Config Report',
-                                          'Statistical Activity',
-                                          'Mode', 'Date'])
-    for file in glob.glob('*.zip'):
-        if '_Config_Report_' not in file:
-            error('"'+file+'" is not a Config Report and will be ignored.',
-                  warning=True)
-            continue
-        fileTitle = os.path.splitext(file)[0]
-        splitTitle = fileTitle.split('_Config_Report_')
-        r = configReports['Config Report'].count()
-        configReports.loc[r, 'Config Report'] = fileTitle
-        configReports.loc[r, 'Statistical Activity'] = splitTitle[0]
-        configReports.loc[r, 'Mode'] = splitTitle[1].split('_')[0]
-        configReports.loc[r, 'Date'] = ' '.join(splitTitle[1].split('_')[1:])
-        print('Unzipping', fileTitle, '...')
-        with ZipFile(file, 'r') as zipObj:
-             zipObj.extractall(fileTitle)
-    return configReports
\ No newline at end of file
+    #Other processes may be unzipping the same folder
+    with folderLock(fol, 'unzip'):
+        manifestFile = os.path.join(cacheFolder(fol), 'Unzip_Manifest.json')
+        try:
+            with open(manifestFile) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        rows = []
+        toExtract = {}
+        for path in folderFiles(fol, '*.zip'):
+            file = os.path.basename(path)
+            if '_Config_Report_' not in file:
+                error('"'+file+'" is not a Config Report and will be ignored.',
+                      warning=True)
+                continue
+            fileTitle = os.path.splitext(file)[0]
+            rows.append(configReportMeta(fileTitle))
+            sha = fileHash(path)
+            if manifest.get(file) == sha \
+            and os.path.isdir(os.path.join(fol, fileTitle)):
+                continue
+            manifest.pop(file, None)
+            toExtract[file] = sha
+        if toExtract != {}:
+            if workers is None:
+                workers = UNZIP_WORKERS
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(extractReport,
+                                       os.path.join(fol, file),
+                                       os.path.join(fol, os.path.splitext(
+                                           file)[0])): file
+                           for file in toExtract}
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        future.result()
+                        manifest[file] = toExtract[file]
+                    except Exception as e:
+                        error('Unable to unzip "'+file+'". '+str(e))
+            with open(manifestFile + '.tmp', 'w') as f:
+                json.dump(manifest, f, indent=1)
+            os.replace(manifestFile + '.tmp', manifestFile)
+        print('Reusing', len(rows) - len(toExtract), 'of', len(rows),
+              'unzipped Config Reports.')
+    return pd.DataFrame(rows, columns=['Config Report', 'Statistical Activity',
+                                       'Mode', 'Date'])
+
+def fileHash(file, chunkSize=1048576):
+    """Returns the SHA-1 hex digest of the contents of the specified file.
+    """
+    sha = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def cacheFolder(fol):
+    """Returns the path of the hidden cache folder inside the specified
+    folder, setting one up if it doesn't already exist.
+    """
+    cacheFol = os.path.join(fol, '.cord_cache')
+    os.makedirs(cacheFol, exist_ok=True)
+    return cacheFol
+
+def savePickle(obj, path):
+    """Pickles obj to path by way of a temporary file, so other processes
+    never see a half written file.
+    """
+    tmpFile = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmpFile, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpFile, path)
+
+def processAlive(pid):
+    """Returns whether the process pid is running on this machine.
+    """
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        #PROCESS_QUERY_LIMITED_INFORMATION
+        handle = kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            #Access is denied to processes that exist but belong to others
+            return ctypes.get_last_error() == 5
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259 #STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def lockHolder(lockFile):
+    """Returns the (host, pid) written in lockFile, or None if it can't be
+    read yet.
+    """
+    try:
+        with open(lockFile, 'r') as f:
+            host, pid = f.read().rsplit(' ', 1)
+        return host, int(pid)
+    except (OSError, ValueError):
+        return None
+
+def lockStale(lockFile, stale):
+    """Returns whether lockFile was left behind by a process that died, as
+    its holder is no longer running on this machine or it hasn't been
+    refreshed for stale seconds.
+    """
+    holder = lockHolder(lockFile)
+    if holder is not None and holder[0] == socket.gethostname() and \
+       not processAlive(holder[1]):
+        return True
+    return time.time() - os.path.getmtime(lockFile) > stale
+
+@contextmanager
+def folderLock(fol, name='folder', stale=600):
+    """Holds a lock file in the cache of the folder fol while the with block
+    runs, waiting for any other process holding it first. The lock records
+    the host and PID of its holder and is refreshed while held, so it's only
+    taken over once its holder has died or it's gone stale seconds without
+    being refreshed.
+    """
+    lockFile = os.path.join(cacheFolder(fol), name + '.lock')
+    holder = socket.gethostname() + ' ' + str(os.getpid())
+    while True:
+        try:
+            fd = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as f:
+                f.write(holder)
+            break
+        except FileExistsError:
+            try:
+                if lockStale(lockFile, stale):
+                    #Renaming is atomic, so only one waiter takes it over
+                    oldFile = lockFile + '.' + str(os.getpid())
+                    os.replace(lockFile, oldFile)
+                    os.remove(oldFile)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.2)
+    held = threading.Event()
+    def refresh():
+        while not held.wait(stale / 4):
+            try:
+                os.utime(lockFile)
+            except OSError:
+                pass
+    refresher = threading.Thread(target=refresh, daemon=True)
+    refresher.start()
+    try:
+        yield lockFile
+    finally:
+        held.set()
+        refresher.join()
+        try:
+            os.remove(lockFile)
+        except OSError:
+            pass
+
+def reportType(name):
+    """Returns the report type of a report csv from its name, eg Itms, Grp,
+    Tasks or External_Datasets_Out.
+    """
+    name = os.path.splitext(os.path.basename(name))[0]
+    return re.split(r'-|_rpt', name, maxsplit=1)[0]
+
+class ReportArchive():
+    """Read access to the report csvs in a CORD report zip, without extracting
+    it to disk.
+    
+    The zip's members are indexed by report type the first time they're
+    looked up, and each member is decompressed as a stream straight into the
+    csv parser.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.title = os.path.splitext(os.path.basename(file))[0]
+        self._zip = None
+        self._types = None
+
+    @property
+    def zip(self):
+        if self._zip is None:
+            self._zip = ZipFile(self.file, 'r')
+        return self._zip
+
+    def members(self, report=None):
+        """Returns the names of the csvs in the zip, or only those of the
+        given report type.
+        """
+        if self._types is None:
+            self._types = {}
+            for name in self.zip.namelist():
+                if not name.lower().endswith('.csv'): continue
+                self._types.setdefault(reportType(name), []).append(name)
+        if report is None:
+            return [name for names in self._types.values() for name in names]
+        return list(self._types.get(report, []))
+
+    def open(self, member):
+        """Returns a binary stream of the decompressed member.
+        """
+        return self.zip.open(member)
+
+    def readCsv(self, member, **kwargs):
+        """Reads the member into a DataFrame, passing kwargs to read_csv.
+        """
+        return readReport((self.file, member), **kwargs)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+def openArchive(file):
+    """Returns the ReportArchive of the zip file, opening it once per process
+    for each version of the zip. If the zip has been replaced since it was
+    opened, the old archive is closed and the new zip opened instead.
+    Archives aren't shared with forked processes as they'd share the handle.
+    """
+    file = os.path.abspath(file)
+    stat = os.stat(file)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (file, os.getpid())
+    with _archivesLock:
+        if key in _archives:
+            oldStamp, archive = _archives[key]
+            if oldStamp == stamp:
+                return archive
+            archive.close()
+        archive = ReportArchive(file)
+        _archives[key] = (stamp, archive)
+        return archive
+
+def closeArchives():
+    """Closes every ReportArchive opened by this process, so the zips can be
+    replaced or deleted, and forgets the ConfigReports loaded so far so
+    their tables can be freed.
+    """
+    with _archivesLock:
+        for key in [key for key in _archives if key[1] == os.getpid()]:
+            _archives.pop(key)[1].close()
+    with _configReportsLock:
+        _configReports.clear()
+
+def openReport(src):
+    """Returns a binary stream of a report, where src is either the filepath
+    of an extracted report or a (zip filepath, member name) tuple.
+    """
+    if isinstance(src, tuple):
+        return openArchive(src[0]).open(src[1])
+    return open(src, 'rb')
+
+#Encodings CORD reports are tried in, latin-1 decodes anything so is the last
+#resort
+REPORT_ENCODINGS = ['utf-8', 'cp1252']
+_reportEncodings = {}
+
+def reportFolder(src):
+    """Returns the zip or folder holding the report src (see openReport).
+    """
+    return os.path.abspath(src[0] if isinstance(src, tuple) else
+                           os.path.dirname(src))
+
+def decodes(data, encoding):
+    try:
+        data.decode(encoding)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def detectEncoding(data):
+    """Returns the first of REPORT_ENCODINGS that decodes all of the bytes
+    data, or most of its non ASCII lines as the rest can be salvaged (see
+    decodeReport). Returns latin-1 if none do, or None if data is plain ASCII
+    as then any of them would do.
+    """
+    if data.isascii():
+        return None
+    lines = None
+    for encoding in REPORT_ENCODINGS:
+        if decodes(data, encoding):
+            return encoding
+        if lines is None:
+            lines = [line for line in data.splitlines() if not line.isascii()]
+        if sum(decodes(line, encoding) for line in lines)*2 > len(lines):
+            return encoding
+    return 'latin-1'
+
+def reportEncoding(src, data):
+    """Returns the encoding of the reports in the zip or folder of src,
+    detecting it from data the first time a report there isn't plain ASCII.
+    """
+    key = reportFolder(src)
+    if key not in _reportEncodings:
+        encoding = detectEncoding(data)
+        if encoding is None:
+            return REPORT_ENCODINGS[0]
+        _reportEncodings[key] = encoding
+    return _reportEncodings[key]
+
+def decodeLine(line, encoding):
+    """Decodes a single line of bytes with encoding, falling back to each of
+    REPORT_ENCODINGS and then latin-1 if it fails.
+    """
+    for enc in [encoding] + REPORT_ENCODINGS:
+        if decodes(line, enc):
+            return line.decode(enc)
+    return line.decode('latin-1')
+
+def decodeReport(data, encoding):
+    """Decodes the bytes of a report with encoding using the native codec.
+    If any of it fails to decode, only the lines that fail are decoded on
+    their own (see decodeLine), so a stray character doesn't lose the rest.
+    """
+    try:
+        return data.decode(encoding)
+    except UnicodeDecodeError:
+        return ''.join(decodeLine(line, encoding) for line
+                       in data.splitlines(keepends=True))
+
+def readReportText(src, f=None):
+    """Returns the decoded text of the report src (see openReport), or of
+    the rest of it if already open as f.
+    """
+    if f is None:
+        with openReport(src) as f:
+            data = f.read()
+    else:
+        data = f.read()
+    return decodeReport(data, reportEncoding(src, data))
+
+def readReport(src, **kwargs):
+    """Reads the report src (see openReport) into a DataFrame, passing kwargs
+    to read_csv.
+    """
+    return pd.read_csv(io.StringIO(readReportText(src)), **kwargs)
+
+REPORT_META = re.compile(r'\b(Classification|Group|Task|Mapping):\s*')
+
+def parseReportMeta(line):
+    """Returns a dict of the metadata fields in a report's metadata line, eg
+    {'Classification': 'Sector', 'Group': 'G1'} for a Grp report.
+    """
+    parts = REPORT_META.split(line)
+    return {parts[i]: parts[i+1].strip() for i in range(1, len(parts)-1, 2)}
+
+def readReportLines(f, dataStart, encoding=REPORT_ENCODINGS[0]):
+    """Reads the first dataStart raw lines of the open report f, leaving f at
+    the start of the table. Returns each line without the empty csv fields
+    that pad it out to the width of the table, so commas within the line,
+    eg in a task's name, are kept.
+    """
+    lines = []
+    for i in range(dataStart):
+        line = decodeLine(f.readline(), encoding).rstrip('\r\n')
+        fields = next(csv.reader([line]), [])
+        while fields != [] and fields[-1] == '':
+            fields.pop()
+        lines.append(','.join(fields))
+    return lines
+
+def readReportMeta(src, dataStart=3):
+    """Reads only the metadata lines at the top of the report src (see
+    openReport). Returns the metadata fields of its second line (see
+    parseReportMeta) and the byte offset the table starts at.
+    """
+    encoding = _reportEncodings.get(reportFolder(src), REPORT_ENCODINGS[0])
+    with openReport(src) as f:
+        lines = readReportLines(f, dataStart, encoding)
+        return parseReportMeta(lines[1] if len(lines) > 1 else ''), f.tell()
+
+def readReportTable(src, dataStart=3, **kwargs):
+    """Reads the report src (see openReport) in a single pass, returning the
+    metadata fields of its second line (see parseReportMeta) and its table.
+    The table starts dataStart lines in and kwargs are passed to read_csv.
+    """
+    encoding = _reportEncodings.get(reportFolder(src), REPORT_ENCODINGS[0])
+    with openReport(src) as f:
+        lines = readReportLines(f, dataStart, encoding)
+        text = readReportText(src, f)
+    meta = parseReportMeta(lines[1] if len(lines) > 1 else '')
+    return meta, pd.read_csv(io.StringIO(text), **kwargs)
+
+def reportName(src):
+    """Returns the file name of the report src (see openReport).
+    """
+    return os.path.basename(src[1] if isinstance(src, tuple) else src)
+
+def reportHash(src, chunkSize=1048576):
+    """Returns the SHA-1 hex digest of the contents of the report src (see
+    openReport).
+    """
+    if not isinstance(src, tuple):
+        return fileHash(src, chunkSize)
+    sha = hashlib.sha1()
+    with openReport(src) as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class ConfigReport():
+    """The reports of a single Config Report, either a zip or a folder it has
+    been unzipped to.
+
+    The report csvs are indexed by type once, and each table is only parsed
+    the first time it's asked for. Tables are handed out as copies, so a
+    script can change what it's given without affecting the next one.
+    """
+    def __init__(self, src):
+        self.src = os.path.abspath(src)
+        self.title = os.path.splitext(os.path.basename(self.src))[0]
+        self._types = None
+        self._srcs = None
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def _index(self):
+        with self._lock:
+            if self._types is None:
+                self._indexReports()
+        return self._types
+
+    def _indexReports(self):
+        if os.path.isdir(self.src):
+            srcs = folderFiles(self.src, '*.csv')
+            names = srcs
+        else:
+            archive = openArchive(self.src)
+            names = archive.members()
+            srcs = [(archive.file, member) for member in names]
+        self._types = {}
+        self._srcs = []
+        for name, src in sorted(zip(names, srcs)):
+            self._types.setdefault(reportType(name), []).append(src)
+            self._srcs.append(src)
+
+    def reportTypes(self):
+        """Returns the report types held in the Config Report.
+        """
+        return list(self._index())
+
+    def sources(self, report=None):
+        """Returns the report sources (see openReport) of every csv, or only
+        those of the given report type.
+        """
+        types = self._index()
+        if report is None:
+            return list(self._srcs)
+        return list(types.get(report, []))
+
+    def has(self, report):
+        return report in self._index()
+
+    def _parse(self, key, parser):
+        with self._lock:
+            if key not in self._tables:
+                self._tables[key] = parser()
+            return self._tables[key]
+
+    def table(self, report, skiprows=3):
+        """Returns the table of the first report of the given type, or an
+        empty DataFrame if there isn't one.
+        """
+        def parser():
+            srcs = self.sources(report)
+            if srcs == []:
+                return pd.DataFrame()
+            return readReport(srcs[0], skiprows=skiprows)
+        return self._parse(('table', report, skiprows), parser).copy()
+
+    def tables(self, report, skiprows=3):
+        """Returns a list of (metadata, table) for every report of the given
+        type, where metadata is the dict of fields in the report's metadata
+        line (see parseReportMeta), eg Classification or Task.
+        """
+        def parser():
+            return [readReportTable(src, skiprows) for src
+                    in self.sources(report)]
+        return [(dict(meta), df.copy()) for meta, df
+                in self._parse(('tables', report, skiprows), parser)]
+
+    @property
+    def tasks(self):
+        return self.table('Tasks')
+
+    @property
+    def taskLines(self):
+        return self.tables('TskLn')
+
+    @property
+    def calculations(self):
+        return self.table('Calculations')
+
+    @property
+    def consistencyChecks(self):
+        return self.table('Consistency_Checks')
+
+    @property
+    def imports(self):
+        return self.table('Import_Definitions')
+
+    @property
+    def exports(self):
+        return self.table('Export_Definitions')
+
+    @property
+    def visualisations(self):
+        return self.table('Visualisations')
+
+    @property
+    def parameters(self):
+        return self.table('Parameters')
+
+    @property
+    def classGroups(self):
+        return self.tables('Grps')
+
+    @property
+    def extClassificationsOut(self):
+        return self.table('External_Classifications_Out', skiprows=4)
+
+    @property
+    def extDatasetsOut(self):
+        return self.table('External_Datasets_Out')
+
+    @property
+    def extDatasetsIn(self):
+        return self.table('External_Datasets_In')
+
+    @property
+    def datasetDefinitions(self):
+        return self.table('Dataset_Definitions')
+
+_configReports = {}
+_configReportsLock = threading.Lock()
+_archives = {}
+_archivesLock = threading.Lock()
+#Number of threads loadConfigReports parses tables over, None uses the
+#ThreadPoolExecutor default
+LOAD_WORKERS = None
+
+def loadConfigReport(src):
+    """Returns the ConfigReport of src, reusing the one already loaded if src
+    hasn't changed since, so its parsed tables are shared by every script
+    that asks for it until closeArchives is called.
+    """
+    src = os.path.abspath(src)
+    stat = os.stat(src)
+    key = (src, stat.st_mtime, stat.st_size)
+    with _configReportsLock:
+        if key not in _configReports:
+            _configReports[key] = ConfigReport(src)
+        return _configReports[key]
+
+def loadConfigReports(srcs, tables=(), workers=None):
+    """Returns the ConfigReports of srcs (see loadConfigReport), parsing the
+    named tables of each, eg 'calculations' or 'taskLines', over a pool of
+    worker threads so they're ready before they're needed.
+    """
+    def load(src):
+        report = loadConfigReport(src)
+        for table in tables:
+            getattr(report, table)
+        return report
+    if workers is None:
+        workers = LOAD_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(load, srcs))
@@ -1,308 +1,367 @@
 # -*- coding: utf-8 -*-"
 """This script is a work in progress and is not currently functional.
 """
-import glob, os
+import glob, os, sys, hashlib, pickle, json, time, datetime, gzip
 import CORDtools as ct
+import CORDhierarchy as ch
+import CORDmappings as cm
 import pandas as pd
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
 import itertools as it
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
 
-def createProductDf(df):
-    df = df.replace('', np.nan)
-    lists = []
-    for col in df.columns:
-        lists.append(df.loc[:, col].dropna().tolist())
-    prodDf = pd.DataFrame(list(it.product(*lists)), columns=df.columns)
-    prodDf = prodDf.drop_duplicates()
-    prodDf = prodDf.reset_index(drop=True)
-    return prodDf
-
-def unpackClassMaps():
-    global classMaps
-    print('Unpacking Classification Mappings...')
-    for file in glob.glob('*.csv'):
-        #print(file)
-        if 'MpItm' in file:
-            try:
-                meta = pd.read_csv(file, header=None, nrows=2,
-                                   encoding='unicode_escape')
-                mapItm = meta.loc[1,0].split('Mapping: ')[1].strip()
-                mapDf = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Source Code': lambda x: \
-                                                str(x),
-                                                'Target Code': lambda x: \
-                                                str(x)})
-                for r in mapDf.index:
-                    src = mapDf.loc[r, 'Source Code'].strip()
-                    targ = mapDf.loc[r, 'Target Code'].strip()
-                    classMaps.loc[r, mapItm] = src+':'+targ
-            except Exception as e:
-                ct.error(e)
-    print('Classification Mappings Unpacked!')
+def descendantsOf(clas, parent):
+    """Returns a list of every code below parent in the classification clas.
+    Raises a KeyError if there is no parent child group for clas:parent.
+    """
+    if clas not in hierarchies or not hierarchies[clas].isParent(parent):
+        raise KeyError(clas + ':' + parent)
+    return list(hierarchies[clas].descendants(parent))
+    
+def taskRecords(taskDf):
+    """Parses a Task Report dataframe into a list of flat (task, criteria,
+    value, mapping type) records in a single pass over its rows.
+    """
+    records = []
+    rows = zip(taskDf[0], taskDf[2], taskDf[9], taskDf[13], taskDf[14],
+               ct.parseCordSeries(taskDf[15]), ct.parseCordSeries(taskDf[16]))
+    for order, task, targData, calcType, objDets, selItems, dimItems in rows:
+        task = task.strip()
+        for item in selItems:
+            if item.op == '=':
+                records.append((task, item.key, item.value, 'Selection'))
+        #Don't add subtasks or delete calcs to the taskGrpDf
+        if calcType.strip() in {'SUB TASK', 'DELETE DATA'}:
+            continue
+        if 'name = ' in objDets:
+            srcData = objDets.split('name = ')[1].split('}')[0].strip()
+        else:
+            srcData = np.nan
+        records.extend([(task, 'Type', calcType.strip(), 'Detail'),
+                        (task, 'Obj Dets', objDets.strip(), 'Detail'),
+                        (task, 'Order', order, 'Detail'),
+                        (task, 'Target Dataset', targData, 'Detail'),
+                        (task, 'Source Dataset', srcData, 'Detail')])
+        for item in dimItems:
+            if item.mapType == 'Indirect':
+                indMap = str(item.mapping).split(' (from ')[0].strip()
+                records.append((task, 'Indirect Dimension Mappings',
+                                item.value+':'+item.key+':'+indMap,
+                                'Indirect'))
+            elif item.mapType == 'Direct':
+                if item.key != item.value:
+                    records.append((task, 'Direct Dimension Mappings',
+                                    item.key + ' = ' + item.value, 'Direct'))
+            elif item.mapType == 'Unmapped':
+                records.append((task, 'Unmapped Dimension Mappings',
+                                item.value + ':' + item.key, 'Unmapped'))
+    return records
 
-def unpackClassGroups():
-    global classGrps
-    print('Unpacking Classification Groups...')
-    for file in glob.glob('*.csv'):
-        if 'Grp' in file and 'Grps' not in file:
-            try:
-                meta = pd.read_csv(file, header=None, nrows=2,
-                                   encoding='unicode_escape')
-                info = meta.loc[1,0].split('Classification: ')
-                info = info[1].split('Group: ')
-                clas = info[0].strip()
-                if clas == 'ZZZZ_SIC 2007 with EUROSTAT inds':
-                    clas = 'Industry'
-                grp = info[1].strip()
-                header = clas +':'+ grp
-                grpDf = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Code': lambda x: str(x)})
-                for r, code in enumerate(grpDf.loc[:, 'Code']):
-                    classGrps.loc[r, header] = code.strip()
-            except Exception as e:
-                ct.error(e)
-    print('Classification Groups Unpacked!')
+def pivotTaskRecords(records):
+    """Builds the wide taskGrps dataframe (criteria as rows, tasks as columns)
+    from the flat records produced by taskRecords.
     
-def unpackPCLinks():
-    global pcDf
-    print('Unpacking Parent Child Links...')
-    for file in glob.glob('*.csv'):
-        if 'PCLnk' in file:
-            try:
-                meta = pd.read_csv(file, header=None, nrows=2,
-                                   encoding='unicode_escape')
-                clas = meta.loc[1,0].split('Classification: ')[1].strip()
-                if clas == 'ZZZZ_SIC 2007 with EUROSTAT inds':
-                    clas = 'Industry'
-                pcTmp = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Parent Code': lambda x: \
-                                                str(x),
-                                                'Child Code': lambda x: \
-                                                str(x)})
-                for r, parent in enumerate(pcTmp.loc[:, 'Parent Code']):
-                    header = clas + ':' + parent
-                    child = pcTmp.loc[r, 'Child Code']
-                    if header not in pcDf.columns:
-                        pcDf.loc[0, header] = child
-                    if child not in pcDf[header].tolist():
-                        pcDf.loc[pcDf[header].count(), header] = child
-            except Exception as e:
-                ct.error(e)
-    for c, col in enumerate(pcDf.columns):
-        for r, child in enumerate(pcDf[col]):
-            clas = col.split(':')[0]
-            child = str(child)
-            header = clas + ':' + child
-            if header in pcDf.columns:
-                pcDf[col] = pcDf[col].dropna().append(pcDf[header],
-                                                      ignore_index=True)
-    print('Parent Child Links Unpacked!')
+    Mapping records are joined into a single string per task using the
+    separator expected by fillSelCritDfs. For all other records the last value
+    read for a task wins.
+    """
+    recDf = pd.DataFrame.from_records(records, columns=['Task', 'Criteria',
+                                                        'Value',
+                                                        'Mapping Type'])
+    mapSeps = {'Indirect': ', ', 'Direct': ', ', 'Unmapped': '/'}
+    isMap = recDf['Mapping Type'].isin(list(mapSeps))
+    parts = [recDf.loc[~isMap, ['Task', 'Criteria', 'Value']]\
+             .drop_duplicates(subset=['Task', 'Criteria'], keep='last')]
+    for mapType, sep in mapSeps.items():
+        mapDf = recDf[recDf['Mapping Type']==mapType]
+        parts.append(mapDf.groupby(['Task', 'Criteria'], sort=False)\
+                     ['Value'].agg(sep.join).reset_index())
+    longDf = pd.concat(parts, ignore_index=True)
+    rows = list(pd.unique(longDf['Criteria']))
+    for mapRow in ['Unmapped Dimension Mappings', 'Direct Dimension Mappings',
+                   'Indirect Dimension Mappings']:
+        if mapRow not in rows:
+            rows.append(mapRow)
+    wideDf = longDf.pivot(index='Criteria', columns='Task', values='Value')
+    wideDf = wideDf.reindex(index=rows, columns=pd.unique(recDf['Task']))
+    wideDf.index.name = None
+    wideDf.columns.name = None
+    return wideDf
+
+def readClassification(file):
+    """Reads a classification Itms report. Returns the classification name and
+    a list of its codes.
+    """
+    meta, classDf = ct.readReportTable(file,
+                                       converters={'Code': lambda x: str(x)})
+    header = meta['Classification']
+    if header == 'ZZZZ_SIC 2007 with EUROSTAT inds':
+        header = 'Industry'
+    if header == 'Adjustment Type':
+        header = 'Adjustment'
+    return header, classDf['Code'].str.strip().tolist()
+
+def readClassGroup(file, clas=None):
+    """Reads a classification item group Grp report. Returns the group header
+    (in the format classification:group) and a list of its codes. If clas is
+    given it is used instead of the classification name in the file.
+    """
+    meta, grpDf = ct.readReportTable(file,
+                                     converters={'Code': lambda x: str(x)})
+    if clas is None:
+        clas = meta['Classification']
+        if clas == 'ZZZZ_SIC 2007 with EUROSTAT inds':
+            clas = 'Industry'
+    grp = meta['Group']
+    return clas + ':' + grp, grpDf['Code'].str.strip().tolist()
+
+def readTaskReport(file):
+    """Reads a Task Report csv and returns its flat task records.
+    """
+    taskDf = ct.readReport(file, skiprows=6, header=None)
+    taskDf = taskDf.replace(np.nan, 'n/a')
+    return taskRecords(taskDf)
+
+def readExtDatasets(file):
+    """Reads an External_Datasets_Out report into a dependancies dataframe.
+    """
+    tempDf = ct.readReport(file, skiprows=3)
+    depDf = pd.DataFrame({'Stat Act': tempDf['Stat Activity'],
+                          'Mode': tempDf['Mode'],
+                          'Task Name': tempDf['Name'],
+                          'Effected Dataset': tempDf['Dataset']})
+    depDf['Source Dataset'] = tempDf['Type Specific Details']\
+        .str.split('name = ').str[1].str.split('}').str[0].str.strip()
+    depDf['Selection Criteria'] = tempDf['Selection Criteria']
+    if 'Dimension Mappings' in tempDf.columns:
+        depDf['Dimension Mappings'] = tempDf['Dimension Mappings']
+    else:
+        depDf['Dimension Mappings'] = np.nan
+    return depDf
+
+def readDatasetDefs(file):
+    """Reads a Dataset_Definitions report and returns a dataframe with a
+    column of dimensions for each dataset.
+    """
+    try:
+        prelimDatasetDf = ct.readReport(file, engine='python', skiprows=3)
+    except:
+        ct.error('CORD has formatted Dataset Definitions badly. Please ' + 
+              'manually reformat Dataset_Definitions_rpt so that columns'+
+              ' align.')
+        return pd.DataFrame()
+    dimCols = [col for col in prelimDatasetDf.columns if 'Dimension' in col]
+    dims = {}
+    for r, dataset in enumerate(prelimDatasetDf['Name']):
+        dims[dataset] = []
+        for col in dimCols:
+            if prelimDatasetDf.loc[r, col].strip() == 'n/a': continue
+            dims[dataset].append(prelimDatasetDf.loc[r, col]\
+                .split('{name = ')[1].split('}')[0].strip())
+    return pd.DataFrame({dataset: pd.Series(dimList, dtype=object)
+                         for dataset, dimList in dims.items()})
+
+def ingestFile(job):
+    """Runs a single ingestion job of (kind, report source, keyword
+    arguments). Returns the kind, the reader's result and an error message if
+    it failed.
     
-def unpackTasks():
-    global taskGrps
-    global taskDf
-    global mappedIdxs
-    print('Unpacking Tasks...')
-    for file in glob.glob('*.csv'):
+    Defined at module level so it can be sent to worker processes.
+    """
+    kind, file, kwargs = job
+    try:
+        return kind, INGESTERS[kind](file, **kwargs), None
+    except Exception as e:
+        return kind, None, ct.reportName(file) + ': ' + str(e)
+
+def zipJobs(zipFile, taskAct):
+    """Returns the ingestion jobs for the reports in zipFile. Each report is
+    read straight from the zip as a (zip filepath, member name) source, and
+    is looked up by its type in the zip's index rather than by matching every
+    member name.
+    """
+    cacheFol = ct.cacheFolder(inputFile)
+    report = ct.loadConfigReport(os.path.join(inputFile, zipFile))
+    aDir = report.title
+    #The ingester and its arguments for each report type to read
+    wanted = {}
+    nameFilter = None
+    jobs = []
+    if 'National Accounts_Config_Report' in aDir:
+        wanted = {'PCLnk': ('PCLnk', {'clas': 'CPA', 'cacheFol': cacheFol}),
+                  'Grp': ('Grp', {'clas': 'CPA'})}
+        nameFilter = 'CPA2008_235_Hierarchy'
+    else:
+        if '_Config_Report_' in aDir and taskAct not in aDir:
+            wanted.update({'Itms': ('Itms', {}), 'Grp': ('Grp', {}),
+                           'PCLnk': ('PCLnk', {'cacheFol': cacheFol}),
+                           'MpItm': ('MpItm', {})})
+        if taskAct+'_Task_Report_' in aDir:
+            jobs.extend(('Task', file, {}) for file in report.sources())
+        if taskAct+'_Config_Report_' in aDir:
+            wanted.update({'MpItm': ('MpItm', {}),
+                           'External_Datasets_Out': ('ExtDatasets', {}),
+                           'Dataset_Definitions': ('DatasetDefs', {})})
+    for rType in report.reportTypes():
+        if rType not in wanted: continue
+        kind, kwargs = wanted[rType]
+        for file in report.sources(rType):
+            if nameFilter is None or nameFilter in ct.reportName(file):
+                jobs.append((kind, file, dict(kwargs)))
+    return jobs
+
+def runIngestion(jobs, workers=None):
+    """Runs the ingestion jobs over a pool of worker processes and returns
+    their results in the same order as jobs. Falls back to reading the files
+    one at a time if a process pool can't be used.
+    """
+    print('Reading', len(jobs), 'report files...')
+    if workers != 1 and len(jobs) > 1:
         try:
-            taskDf = pd.read_csv(file, skiprows=6, header=None,
-                                 encoding='unicode_escape')
-            taskDf = taskDf.replace(np.nan, 'n/a')
-            for r, task in enumerate(taskDf.loc[:, 2]):
-                directMaps = []
-                indirectMaps = []
-                selCrit = taskDf.loc[r, 15]
-                if selCrit != 'n/a':
-                    for item in ct.splitCordString(selCrit, clas=False):
-                        crit = item.split(' = ')[0].strip()
-                        sel = item.split(' = ')[1].strip()
-                        taskGrps.loc[crit, task.strip()] = sel
-                #Don't add subtasks or delete calcs to the taskGrpDf
-                if taskDf.loc[r, 13].strip() in {'SUB TASK', 'DELETE DATA'}:
-                    continue
-                taskGrps.loc['Type', task.strip()] = taskDf.loc[r, 13].strip()
-                taskGrps.loc['Obj Dets', task.strip()] = \
-                             taskDf.loc[r, 14].strip()
-                taskGrps.loc['Order', task.strip()] = taskDf.loc[r, 0]
-                taskGrps.loc['Target Dataset', task.strip()] = taskDf.loc[r, 9]
-                if 'name = ' in taskDf.loc[r, 14]:
-                    targData = taskDf.loc[r, 14].split('name = ')[1]\
-                    .split('}')[0].strip()
-                else:
-                    targData = np.nan
-                taskGrps.loc['Source Dataset', task.strip()] = targData
-                dimMaps = taskDf.loc[r, 16]
-                if 'Unmapped Dimension Mappings' not in taskGrps.index:
-                    taskGrps.loc['Unmapped Dimension Mappings', task.strip()]\
-                    = np.nan
-                if 'Direct Dimension Mappings' not in taskGrps.index:
-                    taskGrps.loc['Direct Dimension Mappings', task.strip()]\
-                    = np.nan
-                if 'Indirect Dimension Mappings' not in taskGrps.index:
-                    taskGrps.loc['Indirect Dimension Mappings', task.strip()]\
-                    = np.nan
-                dims = ct.splitCordString(dimMaps, clas=False)
-                for d, dim in enumerate(dims):
-                    if '(Indirect)' in dim:
-                        #print(dim)
-                        #error('Indirect mapping found, it will be ignored!')
-                        targCrit = dim.split('-> (Indirect)')[0].strip()
-                        srcCrit = dim.split('-> (Indirect)')[1].strip()
-                        indMap = dims[d+1]\
-                                    .split('classification mapping = ')[1]\
-                                    .split(' (from ')[0].strip()
-                        del dims[d+1]                                    
-                        #print(indMap)
-                        
-                        indirectMaps.append(srcCrit+':'+targCrit+':'+indMap)
-                        taskGrps.loc['Indirect Dimension Mappings', 
-                                     task.strip()] = ', '.join(indirectMaps)
-                        continue
-                    if '(Direct)' in dim:
-                        crit = dim.split('-> (Direct) ')[1].strip()
-                        origCrit = dim.split('-> (Direct) ')[0].strip()
-                        if origCrit != crit:
-                            directMaps.append(origCrit + ' = ' + crit)
-                    if directMaps != []:
-                        taskGrps.loc['Direct Dimension Mappings',
-                                     task.strip()] = ', '.join(directMaps)
-                    if '(Unmapped)' in dim:
-                        crit = dim.split('-> (Unmapped) ')[1].strip()
-                        sel = dim.split('-> (Unmapped) ')[0].strip() 
-                        if pd.isnull(taskGrps.loc\
-                                     ['Unmapped Dimension Mappings',
-                                                  task.strip()]):
-                                taskGrps.loc['Unmapped Dimension Mappings',
-                                             task.strip()] = crit + ':' + sel
-                        else:
-                            taskGrps.loc['Unmapped Dimension Mappings',
-                                             task.strip()] \
-                                = taskGrps.loc['Unmapped Dimension Mappings',
-                                               task.strip()]+'/'+crit+':'+sel
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(ingestFile, jobs, chunksize=8))
         except Exception as e:
-            ct.error(e)
-    print('Tasks Unpacked!')
-    
-def unpackClassifications():
-    global classifications
-    print('Unpacking Classifications...')
-    for file in glob.glob('*.csv'):
-        if 'Itms' in file:
+            ct.error('Unable to read reports in parallel, reading them one '+
+                     'at a time instead. ' + str(e), warning=True)
+    return [ingestFile(job) for job in jobs]
+
+def zipHash(zipFile):
+    """Returns the hash of the contents of zipFile in the INPUT folder,
+    only hashing it again if its modified time or size have changed.
+    """
+    path = os.path.join(inputFile, zipFile)
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in zipHashes:
+        zipHashes[key] = ct.fileHash(path)
+    return zipHashes[key]
+
+def partitionPath(zipFile, taskAct):
+    """Returns the filepath of the cached ingestion results of zipFile. The
+    key covers the zip's contents and whether it belongs to taskAct, as that
+    decides which reports are read.
+    """
+    title = os.path.splitext(zipFile)[0]
+    role = taskAct if taskAct in title else ''
+    sha = hashlib.sha1(('v' + str(INDEX_VERSION) + title + role).encode())
+    sha.update(zipHash(zipFile).encode())
+    return os.path.join(ct.cacheFolder(inputFile),
+                        'Partition_' + sha.hexdigest() + '.pkl')
+
+def ingestPartitions(zips, taskAct):
+    """Returns the ingestion results of every report zip in zips. Each zip is
+    a partition whose results are cached for that version of the zip, so only
+    new or changed reports are read.
+    """
+    parts = []
+    jobs = []
+    for zipFile in zips:
+        path = partitionPath(zipFile, taskAct)
+        if os.path.exists(path):
             try:
-                meta = pd.read_csv(file, header=None, nrows=2,
-                                   encoding='unicode_escape')
-                header = meta.loc[1,0].split('Classification: ')[1].strip()
-                if header == 'ZZZZ_SIC 2007 with EUROSTAT inds':
-                    header = 'Industry'
-                if header == 'Adjustment Type':
-                    header = 'Adjustment'
-                classDf = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Code': lambda x: str(x)})
-                for r, code in enumerate(classDf.loc[:, 'Code']):
-                    classifications.loc[r, header] = code.strip()
+                with open(path, 'rb') as f:
+                    parts.append((None, pickle.load(f)))
+                continue
             except Exception as e:
-                ct.error(e)
-                
-    classifications.loc[[0,1,2], 'Periodicity'] = ['A', 'Q', 'M']
-    classifications.loc[range(13), 'Prices'] = ['CP', 'DEF', 'VM', 'CVM',
-                        'PYP', 'CYP', 'IDEF', 'KQ', 'PYQ', 'CYQ', 'CRP', 'PRP',
-                        'CVMRE']
-    classifications.loc[range(13), 'Price'] = ['CP', 'DEF', 'VM', 'CVM',
-                        'PYP', 'CYP', 'IDEF', 'KQ', 'PYQ', 'CYQ', 'CRP', 'PRP',
-                        'CVMRE']
-    print('Classifications Unpacked!')
-    
+                ct.error('Unable to load cached reports for ' + zipFile +
+                         ', rereading them. ' + str(e), warning=True)
+        zipJobList = zipJobs(zipFile, taskAct)
+        if zipJobList == []: continue
+        parts.append((path, slice(len(jobs), len(jobs)+len(zipJobList))))
+        jobs.extend(zipJobList)
+    print('Reusing', len(parts) - sum(1 for path, part in parts
+                                       if isinstance(part, slice)),
+          'of', len(parts), 'report zips.')
+    jobResults = runIngestion(jobs, INGEST_WORKERS) if jobs != [] else []
+    ct.closeArchives()
+    results = []
+    for path, part in parts:
+        if isinstance(part, slice):
+            part = jobResults[part]
+            #Only cache partitions that were read without errors
+            if all(err is None for k, r, err in part):
+                ct.savePickle(part, path)
+        results.extend(part)
+    return results
+
+def mergeIngestion(results):
+    """Merges the results of the ingestion jobs into the model.
+    """
+    global classifications
+    global classGrps
+    global classMaps
+    global hierarchies
+    global taskGrps
+    global dependanciesDf
+    global datasetCritDf
+    clasCols = {}
+    grpCols = {}
+    records = []
+    #Start from new objects so models already held in statActModels are
+    #left untouched
+    hierarchies = {}
+    classMaps = {}
+    depDfs = [pd.DataFrame(columns=DEPENDANCY_COLS)]
+    for kind, result, err in results:
+        if err is not None:
+            ct.error(err)
+            continue
+        if kind == 'Itms':
+            clasCols[result[0]] = pd.Series(result[1], dtype=object)
+        if kind == 'Grp':
+            grpCols[result[0]] = pd.Series(result[1], dtype=object)
+        if kind == 'PCLnk':
+            ch.addHierarchy(hierarchies, *result)
+        if kind == 'MpItm':
+            classMaps[result.name] = result
+        if kind == 'Task':
+            records.extend(result)
+        if kind == 'ExtDatasets':
+            depDfs.append(result)
+        if kind == 'DatasetDefs':
+            datasetCritDf = result
+    prices = ['CP', 'DEF', 'VM', 'CVM', 'PYP', 'CYP', 'IDEF', 'KQ', 'PYQ',
+              'CYQ', 'CRP', 'PRP', 'CVMRE']
+    clasCols['Periodicity'] = pd.Series(['A', 'Q', 'M'])
+    clasCols['Prices'] = pd.Series(prices)
+    clasCols['Price'] = pd.Series(prices)
+    classifications = pd.DataFrame(clasCols)
+    classGrps = pd.DataFrame(grpCols)
+    taskGrps = pivotTaskRecords(records)
+    dependanciesDf = pd.concat(depDfs, ignore_index=True)
+    print('Reports unpacked!')
+
 def readTargSelCrit(calc):
-    homePath = os.getcwd()
-    os.chdir(procFile)
-    preDf = pd.read_csv(calc+'.csv', engine='python')
-    df = pd.read_csv(calc + '.csv', engine='python', converters={i: str \
+    path = os.path.join(procFile, calc + '.csv')
+    preDf = pd.read_csv(path, engine='python')
+    df = pd.read_csv(path, engine='python', converters={i: str \
                                 for i in preDf.columns.tolist()})
-    os.chdir(homePath)
     #print('read crit:\n', df)
     return df
 
-def addNatAccs():
-    global pcDf
-    global classGrps
-    homePath = os.getcwd()
-    os.chdir(inputFile)
-    dirs = filter(os.path.isdir, os.listdir())
-    for aDir in dirs:
-        if 'National Accounts_Config_Report' in aDir:
-            os.chdir(aDir)
-            for file in glob.glob('*.csv'):
-                if 'PCLnk-CPA2008_235_Hierarchy' in file:
-                    #meta = pd.read_csv(file, header=None, nrows=2,
-                                   #encoding='unicode_escape')
-                    #clas = meta.loc[1,0].split('Classification: ')[1].strip()
-                    clas = 'CPA'
-                    pcTmp = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Parent Code': lambda x: \
-                                                str(x),
-                                                'Child Code': lambda x: \
-                                                str(x)})
-                    for r, parent in enumerate(pcTmp.loc[:, 'Parent Code']):
-                        header = clas + ':' + parent
-                        child = pcTmp.loc[r, 'Child Code']
-                        if header not in pcDf.columns:
-                            pcDf.loc[0, header] = child
-                        if child not in pcDf[header].tolist():
-                            pcDf.loc[pcDf[header].count(), header] = child
-                if 'Grp' in file and 'CPA2008_235_Hierarchy' in file \
-                and 'Grps' not in file:
-                    try:
-                        meta = pd.read_csv(file, header=None, nrows=2,
-                                   encoding='unicode_escape')
-                        info = meta.loc[1,0].split('Classification: ')
-                        info = info[1].split('Group: ')
-                        clas = 'CPA'
-                        grp = info[1].strip()
-                        header = clas +':'+ grp
-                        grpDf = pd.read_csv(file, skiprows=3,
-                                    encoding='unicode_escape',
-                                    converters={'Code': lambda x: str(x)})
-                        for r, code in enumerate(grpDf.loc[:, 'Code']):
-                            classGrps.loc[r, header] = code.strip()
-                    except Exception as e:
-                        ct.error(e)
-    for c, col in enumerate(pcDf.columns):
-        for r, child in enumerate(pcDf[col]):
-            clas = col.split(':')[0]
-            child = str(child)
-            header = clas + ':' + child
-            if header in pcDf.columns:
-                pcDf[col] = pcDf[col].dropna().append(pcDf[header],
-                                                      ignore_index=True)
-    os.chdir(homePath)
-
 def saveSelCrit(calc, df):
-    homePath = os.getcwd()
-    os.chdir(procFile)
-    df.to_csv(calc+'.csv', index=False)
-    os.chdir(homePath)
+    df.to_csv(os.path.join(procFile, calc + '.csv'), index=False)
 
-def fillSelCritDfs():
+def fillSelCritDfs(calcs=None):
+    """Fills the input and output selection criteria of calcs, or of every
+    calc in taskGrps if calcs isn't given.
+    """
     global inCrit
     global outCrit
     global undroppable
     global dropCols
-    inCrit = pd.DataFrame(columns=taskGrps.columns.tolist())
-    outCrit = pd.DataFrame(columns=taskGrps.columns.tolist())
-    undroppable = pd.DataFrame(columns=taskGrps.columns.tolist())
+    if calcs is None:
+        calcs = taskGrps.columns.tolist()
+    inCrit = pd.DataFrame(columns=calcs)
+    outCrit = pd.DataFrame(columns=calcs)
+    undroppable = pd.DataFrame(columns=calcs)
     dropCols = ['Type', 'Order', 'Source Dataset', 'Target Dataset', 
                 'Unmapped Dimension Mappings', 'Obj Dets',
                 'Direct Dimension Mappings', 'Indirect Dimension Mappings']
     print('Filling selection criteria dataframes...')
-    for calc in taskGrps.columns:
+    for calc in calcs:
         #print(calc)
         inCrit[calc] = taskGrps[calc].drop(dropCols, axis=0)
         #Initially set output criteria = to input
@@ -334,21 +393,10 @@ def fillSelCritDfs():
                 sel = item.split(' = ')[1].strip()
                 outCrit.loc[crit, calc] = sel
                 newCrits.append(crit)
-                formSelList = []
-                for classItm in classifications.loc[:, crit]:
-                    for char in ['+', '/', '-', '*', ',', ')', '(', ':']:
-                        formStr = formStr.replace(char, ' ')
-                    splitForm = formStr.split(' ')
-                    #The below loop stops formula items such as 0 being 
-                    #mistaken as classifications
-                    for formEl in splitForm:
-                        try:
-                            float(formEl)
-                            splitForm.remove(formEl)
-                        except:
-                            pass
-                    if classItm in splitForm:
-                        formSelList.append(classItm)
+                formItems = ct.formulaItems(formStr)
+                formSelList = [classItm for classItm in
+                               classifications[crit].dropna()
+                               if classItm in formItems]
                 formSel = ', '.join(formSelList)
                 inCrit.loc[crit, calc] = formSel
             #outCrit.loc['Changes', calc] = ', '.join(newCrits)
@@ -360,8 +408,8 @@ def fillSelCritDfs():
                 .split('top level specification = ')[1]
             parent = parent.split('}')[0].strip()
             try:
-                inCrit.loc[parentType, calc] = ', '.join(pcDf[parentType+':'+
-                      parent].dropna().tolist())
+                inCrit.loc[parentType, calc] = ', '.join(descendantsOf(
+                      parentType, parent))
             except:
                 ct.error('Couldnt find parent child group '+parentType+':'+
                       parent)
@@ -381,8 +429,8 @@ def fillSelCritDfs():
             measure = measure.split('}')[0].strip()
             inCrit.loc[parentType, calc] = parent
             try:
-                outCrit.loc[parentType, calc] = ', '.join(pcDf[parentType+':'+
-                      parent].dropna().tolist())
+                outCrit.loc[parentType, calc] = ', '.join(descendantsOf(
+                      parentType, parent))
             except:
                 ct.error('Couldnt find parent child group '+parentType+':'+
                       parent)
@@ -450,133 +498,248 @@ def fillSelCritDfs():
                 outCrit.loc[crit, calc] = outCrit.loc[origCrit, calc]
                 outCrit.loc[origCrit, calc] = 'nan'
         if pd.notnull(indDimMaps):
-            #print(indDimMaps)
             indDims = indDimMaps.split(', ')
+            #Data moves from srcCrit, in the mapping's target codes, to
+            #targCrit, in its source codes
             for indDim in indDims:
                 srcCrit = indDim.split(':')[0].strip()
                 targCrit = indDim.split(':')[1].strip()
-                group = indDim.split(':')[2].strip()
-                inVals = []
-                outVals = []
-                baseVals = classMaps[group].replace('nan', np.nan)
-                for item in baseVals.dropna().tolist():
-                    inVal = item.split(':')[1]
-                    outVal = item.split(':')[0]
-                    inVals.append(inVal)
-                    outVals.append(outVal)
-            #print('inVals:', inVals)
-            #print('outVals:', outVals)
-            outCrit.loc[targCrit, calc] = ', '.join(outVals)
-            inCrit.loc[srcCrit, calc] = ', '.join(inVals)
+                mapping = classMaps[indDim.split(':')[2].strip()]
+                inVals = mapping.targets()
+                #Restrict the mapping to the calc's existing selections, if
+                #any of them are covered by the mapping
+                if srcCrit in inCrit.index:
+                    curSel = dict(canonCriteria(inCrit.loc[[srcCrit], calc]))
+                    if srcCrit in curSel and '*' not in curSel[srcCrit]:
+                        inVals = [val for val in inVals
+                                  if val in curSel[srcCrit]] or inVals
+                outVals = mapping.unmapCodes(inVals)
+                outCrit.loc[targCrit, calc] = ', '.join(outVals)
+                inCrit.loc[srcCrit, calc] = ', '.join(inVals)
                   
     print('Selection criteria dataframes filled!')
     
+def canonCriteria(critSeries):
+    """Returns the selection criteria in critSeries in a canonical, hashable
+    form: a tuple of (criteria, frozenset of selections) sorted by criteria.
+    
+    Comma separated selections are split, 'group ' prefixes are stripped and
+    criteria without any selections are left out.
+    """
+    canon = {}
+    for crit, cell in critSeries.items():
+        if pd.isnull(cell): continue
+        for sel in str(cell).split(','):
+            sel = sel.strip()
+            if sel[:5] == 'group':
+                sel = sel[6:]
+            if sel in {'', 'nan'}: continue
+            canon.setdefault(crit, set()).add(sel)
+    return tuple(sorted((crit, frozenset(sels))
+                        for crit, sels in canon.items()))
+
+def frameCanon(critDf):
+    """Returns the canonical form of a permuted selection criteria dataframe.
+    """
+    canon = []
+    for col in critDf.columns:
+        sels = frozenset(critDf[col].dropna())
+        if sels:
+            canon.append((col, sels))
+    return tuple(sorted(canon))
+
+@lru_cache(maxsize=4096)
+def expandCriteria(canon):
+    """Returns the dataframe of every permutation of the canonical selection
+    criteria canon. The result is cached so must not be modified.
+    """
+    crits = [crit for crit, sels in canon]
+    lists = [sorted(sels) for crit, sels in canon]
+    return pd.DataFrame(list(it.product(*lists)), columns=crits)
+
+@lru_cache(maxsize=65536)
+def matchCriteria(curCanon, targCanon):
+    """Returns True if a calc with the canonical input criteria curCanon picks
+    up any of the data described by the canonical criteria targCanon.
+    
+    Criteria selected as * in targCanon match anything, but the calc must
+    have no other criteria that targCanon doesn't cover, and every criteria
+    they share must have at least one selection in common.
+    """
+    targ = dict(targCanon)
+    refinedTarg = {crit: sels for crit, sels in targ.items()
+                   if '*' not in sels}
+    cur = {crit: sels for crit, sels in curCanon
+           if not (crit in targ and '*' in sels)}
+    if cur == {}:
+        return False
+    for crit, sels in cur.items():
+        if crit not in refinedTarg:
+            return False
+        if sels.isdisjoint(refinedTarg[crit]):
+            return False
+    return True
+
+def cacheStats():
+    """Prints the hit rates of the selection criteria caches.
+    """
+    for name, func in [('Criteria expansion', expandCriteria),
+                       ('Criteria matching', matchCriteria),
+                       ('Criteria intersection', intersectCriteria)]:
+        info = func.cache_info()
+        calls = info.hits + info.misses
+        rate = 100*info.hits/calls if calls else 0
+        print('%s cache: %s hits, %s misses (%.1f%% hit rate)' % (name,
+              info.hits, info.misses, rate))
+    print('Propagation cache: %s steps stored' % len(matchCache))
+
 def permuteCriteria(critSeries, target=False):
-    global unpermutedTargCriteria
-    prelimCrit = pd.DataFrame(columns = critSeries.index)
-    prelimCrit.loc[0] = critSeries.tolist()
-    for r, cell in enumerate(prelimCrit.loc[0, :]):
-        if ',' in str(cell):
-            splitCell = cell.split(',')
-            for c, val in enumerate(splitCell):
-                prelimCrit.loc[c, prelimCrit.columns[r]] = str(val).strip()
-    #Get rid of any duplicates within each column
-    for col in prelimCrit.columns:
-        for r in prelimCrit.index:
-            if str(prelimCrit.loc[r, col])[:5] == 'group':
-                prelimCrit.loc[r,col] = str(prelimCrit.loc[r, col])[6:]
-        prelimCrit[col] = prelimCrit[col].drop_duplicates()
-    prelimCrit.reset_index(inplace=True, drop=True)
-    droppedCols = []
-    prelimCrit = prelimCrit.replace('nan', np.nan)
-    for col in prelimCrit.columns:
-        if prelimCrit[col].isnull().all():
-            droppedCols.append(col)
-            prelimCrit = prelimCrit.drop(col, axis=1)
+    """Returns a dataframe of every permutation of the selections in
+    critSeries. If target=True the selections are also saved as the target
+    selection criteria of curAffectingCalc.
+    """
+    canon = canonCriteria(critSeries)
     if target:
-        dfToSave = prelimCrit.copy()
-        #print('Target Dataset: ', taskGrps.loc['Target Dataset',
-        #              curAffectingCalc])
+        start = time.perf_counter()
+        dfToSave = pd.DataFrame({crit: pd.Series(sorted(sels))
+                                 for crit, sels in canon})
         dfToSave.loc[0, 'Target Dataset'] = taskGrps.loc['Target Dataset',
                       curAffectingCalc]
-        #print('Saving targetSelCrit of', curAffectingCalc)
-        homePath = os.getcwd()
-        os.chdir(procFile)
         try:
-            existingDf = pd.read_csv(curAffectingCalc+'.csv', engine='python')
+            existingDf = pd.read_csv(os.path.join(procFile, curAffectingCalc +
+                                                  '.csv'), engine='python')
             for col in existingDf.columns:
                 for idx in existingDf.index:
                     if pd.isnull(existingDf.loc[idx, col]): continue
                     item = existingDf.loc[idx, col]
+                    if col not in dfToSave.columns:
+                        dfToSave[col] = np.nan
                     if item not in dfToSave[col].tolist():
                         dfToSave.loc[dfToSave[col].count()+1, col] = item
         except Exception as e:
             #error(e)
             pass
-        os.chdir(homePath)
-        #print(dfToSave)
-        #print('Saving sel crit for', curAffectingCalc)
-        #print(dfToSave)
         saveSelCrit(curAffectingCalc, dfToSave)
-    selCritDf = createProductDf(prelimCrit)
-    return selCritDf
+        addTime('IO', start)
+    start = time.perf_counter()
+    permDf = expandCriteria(canon).copy()
+    addTime('Expansion', start)
+    return permDf
+
+def matchingTasks(targDataset):
+    """Returns the calcs after calcOrderNo that pick up data from targDataset
+    where their input criteria overlap targetCalcSelCrit.
     
-def searchEffectedTasks(targDataset):
-    global effectedDf
-    global outCrit
+    Results are kept in matchCache, so propagation steps with the same inputs
+    are only ever matched once per loaded model.
+    """
+    targCanon = frameCanon(targetCalcSelCrit)
+    key = (targDataset, calcOrderNo, targCanon)
+    if key in matchCache:
+        return matchCache[key]
+    matched = []
     for calc in taskGrps.columns:
         if calc == 'Defined Selection Criteria': continue
         if taskGrps.loc['Order', calc] <= calcOrderNo: continue
         if targDataset not in {taskGrps.loc['Source Dataset', calc],
                                taskGrps.loc['Target Dataset', calc]}:
             continue
-        inCritCopy = inCrit.copy()
-        for col in targetCalcSelCrit.columns:
-            if col not in inCrit.loc[inCrit[calc]!='nan', calc]:
-                #print(col,'not in inCrit for', calc)
-                inCritCopy.loc[col, calc] = ', '.join(targetCalcSelCrit[col]\
-                              .drop_duplicates().tolist())
-        curCalcSelCrit = permuteCriteria(inCritCopy[calc])
-        refinedTargetSelCrit = targetCalcSelCrit.copy()
-        #print(calc)
-        #print('curCalcSelCrit:\n', curCalcSelCrit)
-        #print('refinedTargSelCrit:\n', refinedTargetSelCrit)
-        for col in refinedTargetSelCrit.columns:
-            if '*' in refinedTargetSelCrit[col].tolist():
-                refinedTargetSelCrit.drop(col, axis=1, inplace=True)
-            if col in curCalcSelCrit.columns:
-                if '*' in curCalcSelCrit[col].tolist():
-                    curCalcSelCrit.drop(col, axis=1, inplace=True)
-        try:
-            matchedCrit = curCalcSelCrit.merge(refinedTargetSelCrit)
-        except:
-            matchedCrit = curCalcSelCrit
-        nullMatch = False
-        #print(curCalcSelCrit.dropna(axis=1, how='all').columns.tolist())
-        #print(refinedTargetSelCrit.dropna(axis=1, how='all').columns.tolist())
-        for col in curCalcSelCrit.dropna(axis=1, how='all').columns.tolist():
-            if col not in refinedTargetSelCrit.dropna(axis=1, how='all').columns.tolist():
-                nullMatch = True
-        if nullMatch:
-            matchedCrit = matchedCrit.iloc[0:0]
-        if not matchedCrit.empty:
-            #print(calc)
-            #print(matchedCrit)
-            r = len(effectedDf.index)
-            if calc not in effectedDf['Effected Calc'].tolist():
+        #Criteria the calc doesn't restrict take the target's selections
+        critSeries = inCrit[calc].copy()
+        setCrits = inCrit.index[inCrit[calc]!='nan']
+        for crit, sels in targCanon:
+            if crit not in setCrits:
+                critSeries[crit] = ', '.join(sorted(sels))
+        if matchCriteria(canonCriteria(critSeries), targCanon):
+            matched.append(calc)
+    matchCache[key] = matched
+    return matched
+
+def searchEffectedTasks(targDataset):
+    global effectedDf
+    start = time.perf_counter()
+    matched = matchingTasks(targDataset)
+    addTime('Matching', start)
+    stepTimes['Matched'] += len(matched)
+    for calc in matched:
+        r = len(effectedDf.index)
+        if calc not in effectedDf['Effected Calc'].tolist():
+            effectedDf.loc[r, 'Searched'] = False
+        else:
+            tempMatchedDf = effectedDf[effectedDf['Effected Calc'] == calc]
+            #print('Matched Df\n', tempMatchedDf)
+            if curAffectingCalc not in tempMatchedDf['Effected By']\
+                                            .tolist():
                 effectedDf.loc[r, 'Searched'] = False
             else:
-                tempMatchedDf = effectedDf[effectedDf['Effected Calc'] == calc]
-                #print('Matched Df\n', tempMatchedDf)
-                if curAffectingCalc not in tempMatchedDf['Effected By']\
-                                                .tolist():
-                    effectedDf.loc[r, 'Searched'] = False
-                else:
-                    effectedDf.loc[r, 'Searched'] = True
-            effectedDf.loc[r, 'Effected Calc'] = calc
-            effectedDf.loc[r, 'Effected By'] = curAffectingCalc
-            effectedDf.loc[r, 'Order'] = taskGrps.loc['Order', calc]
+                effectedDf.loc[r, 'Searched'] = True
+        effectedDf.loc[r, 'Effected Calc'] = calc
+        effectedDf.loc[r, 'Effected By'] = curAffectingCalc
+        effectedDf.loc[r, 'Order'] = taskGrps.loc['Order', calc]
     
+def startStep(calc):
+    """Starts timing a propagation step searching from calc.
+    """
+    global stepTimes
+    stepTimes = dict.fromkeys(STEP_PARTS, 0.0)
+    stepTimes.update({'Calc': calc, 'Stat Act': curStatAct, 'Matched': 0,
+                      'Start': time.perf_counter()})
+
+def addTime(part, start):
+    """Adds the time since start to part of the current propagation step.
+    """
+    stepTimes[part] += time.perf_counter() - start
+
+def endStep(permDf, queued):
+    """Records the current propagation step in stepStats, where permDf is the
+    permuted target criteria it searched with and queued the number of steps
+    still waiting. Prints progress with an ETA based on the average step.
+    """
+    step = dict(stepTimes)
+    step['Total'] = time.perf_counter() - step.pop('Start')
+    step['Bookkeeping'] = max(step['Total'] - sum(step[part] for part
+                                                  in STEP_PARTS), 0.0)
+    step['Criteria'] = len(permDf.columns)
+    step['Permutations'] = len(permDf.index)
+    stepStats.append(step)
+    avg = sum(done['Total'] for done in stepStats)/len(stepStats)
+    eta = datetime.timedelta(seconds=int(avg*queued))
+    print('Searched %s in %.2fs (%s permutations, %s matched) - %s done, %s '
+          'queued, ETA %s' % (step['Calc'], step['Total'],
+                              step['Permutations'], step['Matched'],
+                              len(stepStats), queued, eta))
+
+def searchProfile(top=10):
+    """Prints where the time of every propagation step in stepStats went and
+    the top most expensive calcs. The per calc profile is saved to Search
+    Profile.csv in the OUTPUT folder and returned.
+    """
+    if stepStats == []:
+        return pd.DataFrame()
+    stepDf = pd.DataFrame(stepStats)
+    parts = STEP_PARTS + ['Bookkeeping']
+    total = stepDf['Total'].sum()
+    print('\nSearch profile: %s steps in %.2fs' % (len(stepDf.index), total))
+    for part in parts:
+        partTime = stepDf[part].sum()
+        print('    %s: %.2fs (%.1f%%)' % (part, partTime,
+                                           100*partTime/total if total else 0))
+    profileDf = stepDf.groupby(['Stat Act', 'Calc'], sort=False).agg(
+        Steps=('Total', 'size'), Total=('Total', 'sum'),
+        **{part: (part, 'sum') for part in parts},
+        Permutations=('Permutations', 'max'), Matched=('Matched', 'sum'))\
+        .sort_values('Total', ascending=False).reset_index()
+    print('Most expensive calcs:')
+    print(profileDf.head(top)[['Stat Act', 'Calc', 'Steps', 'Total',
+                               'Permutations', 'Matched']]\
+          .to_string(index=False))
+    try:
+        profileDf.to_csv(os.path.join(outputFile, 'Search Profile.csv'),
+                         index=False)
+    except:
+        ct.error('Failed to save Search Profile!')
+    return profileDf
+
 def userInput():
     global calcOrderNo
     global targetCalcSelCrit
@@ -589,8 +752,6 @@ def userInput():
     while calc not in taskGrps.columns:
         ct.error('Calculation Name not found in task definition!')
         calc = input('What is the Name of Calculation being changed?\n')
-    curAffectingCalc = calc
-    calcOrderNo = taskGrps.loc['Order', calc]
     calcDf = pd.DataFrame()
     conf = 'N'
     while conf != 'Y':
@@ -605,129 +766,164 @@ def userInput():
             print(idx, '=', calcDf.loc[idx, calc])
         conf = input('Enter Y to continue or N to redeifne the selection ' + 
                  'criteria: ')
-    for crit in calcDf.index:
-        if calcDf.loc[crit, calc] == '*':
-            calcDf.loc[crit, calc] = outCrit.loc[crit, calc] 
-                                    #Changed inCrit to outCrit
-    targetCalcSelCrit = permuteCriteria(calcDf[calc], target=True)
-    #print(targetCalcSelCrit)
+    setCalcStart(calc, calcDf[calc])
     return 'default'
 
+def setCalcStart(calc, critSeries):
+    """Sets up a search starting from calc, where critSeries holds the
+    selection criteria affected by the change. Criteria of '*' are replaced by
+    all of calc's output criteria.
+    """
+    global calcOrderNo
+    global targetCalcSelCrit
+    global curAffectingCalc
+    curAffectingCalc = calc
+    calcOrderNo = taskGrps.loc['Order', calc]
+    critSeries = critSeries.copy()
+    for crit in critSeries.index:
+        if critSeries[crit] == '*' and crit in outCrit.index:
+            critSeries[crit] = outCrit.loc[crit, calc]
+    targetCalcSelCrit = permuteCriteria(critSeries, target=True)
+
+def setSelCritStart(dataset, critSeries):
+    """Sets up a search starting from dataset, where critSeries holds the
+    selection criteria of the data being changed.
+    """
+    global calcOrderNo
+    global targetCalcSelCrit
+    global curAffectingCalc
+    calcOrderNo = 0
+    taskGrps.loc['Target Dataset', 'Defined Selection Criteria'] = dataset
+    for idx in critSeries.index:
+        taskGrps.loc[idx, 'Defined Selection Criteria'] = critSeries[idx]
+    curAffectingCalc = 'Defined Selection Criteria'
+    targetCalcSelCrit = permuteCriteria(critSeries, target=True)
+
 def fillImpactedDfs():
+    """Saves the impacted selections of each criteria for every dataset to
+    Dataset Impacts.xlsx in the OUTPUT folder, with a sheet per dataset.
+    Returns the impacts as given by summariseImpacts so they can be passed
+    straight on to checkDependencies.
+    """
     global combinedDf
-    os.chdir(procFile)
-    combinedDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        df = pd.read_csv(file, engine='python')
-        df['Target Dataset'] = df['Target Dataset'].replace(np.nan,
-          df.loc[0, 'Target Dataset'])
-        combinedDf = combinedDf.append(df)
-    #combinedDf = combinedDf.replace('nan', np.nan)
-    combinedDf.reset_index(drop=True, inplace=True)
-    writer = pd.ExcelWriter('Dataset Impacts.xlsx', engine='xlsxwriter')
-    for dataset in combinedDf['Target Dataset'].drop_duplicates()\
-                    .dropna().tolist():
-        tempDf = combinedDf[combinedDf['Target Dataset']==dataset].copy()
-        tempDf.drop('Target Dataset', axis=1, inplace=True)
-        impactedDf = pd.DataFrame(columns=tempDf.columns)
-        for col in tempDf.columns:
-            for item in tempDf[col].drop_duplicates().dropna().tolist():
-                impactedDf.loc[impactedDf[col].count(), col] = item
-            #print(datasetCritDf[dataset].dropna().tolist())
-            if col not in datasetCritDf[dataset].dropna().tolist():
-                impactedDf.drop(col, axis=1, inplace=True)
-        #Future develpoment, identify item groups and '*' in impacted
-        """for col in impactedDf.columns:
-            for classGrp in classGrps.columns.tolist():
-                Class = classGrp.split(':')[0]
-                if Class != col: continue
-                try:
-                    if impactedDf[col].tolist() == classifications[col].tolist():
-                        impactedDf.drop(col, axis=1, inplace=True)
-                        impactedDf.loc[0, col] = '*'
-                except:
-                    pass
-                if classGrps[classGrp].tolist() == impactedDf[col].tolist():
-                    impactedDf.drop(col, axis=1, inplace=True)
-                    impactedDf.loc[0, col] = classGrps[classGrp].tolist()"""
-        os.chdir(outputFile)
-        for char in ['[',']',':','*','?','\\','/']:
-            dataset = dataset.replace(char, '')
-        impactedDf.to_excel(writer, sheet_name=dataset, index=False)
-    writer.save()
-    #print(combinedDf)
-
-def datasetCriteria():
-    global datasetCritDf
-    print('Creating dataset criteria dataframe...')
-    for file in glob.glob('*.csv'):
-        if 'Dataset_Definitions' not in file: continue
-        try:
-            prelimDatasetDf = pd.read_csv(file, engine='python', skiprows=3)
-        except:
-            ct.error('CORD has formatted Dataset Definitions badly. Please ' + 
-                  'manually reformat Dataset_Definitions_rpt so that columns'+
-                  ' align.')
-        datasetCritDf = pd.DataFrame(columns=prelimDatasetDf['Name'].tolist())
-        for r, dataset in enumerate(prelimDatasetDf['Name']):
-            for col in prelimDatasetDf.columns.tolist():
-                if 'Dimension' not in col: continue
-                if prelimDatasetDf.loc[r, col].strip() == 'n/a': continue
-                dim = prelimDatasetDf.loc[r, col].split('{name = ')[1]\
-                    .split('}')[0].strip()
-                datasetCritDf.loc[datasetCritDf[dataset].count(), dataset] = \
-                dim
-    print('Dataset criteria dataframe created!')
+    combinedDf = readProcessing()
+    longDf = impactSelections(combinedDf)
+    with pd.ExcelWriter(os.path.join(outputFile, 'Dataset Impacts.xlsx'),
+                        engine='xlsxwriter') as writer:
+        for dataset, datasetDf in longDf.groupby('Target Dataset',
+                                                 sort=False):
+            uniqueSels = datasetDf.groupby('Criteria', sort=False)\
+                ['Selections'].unique()
+            impactedDf = pd.DataFrame({crit: pd.Series(sels) for crit, sels
+                                       in uniqueSels.items()})
+            #Future develpoment, identify item groups and '*' in impacted
+            for char in ['[',']',':','*','?','\\','/']:
+                dataset = dataset.replace(char, '')
+            impactedDf.to_excel(writer, sheet_name=dataset, index=False)
+    return joinSelections(longDf)
 
 def delProcessing():
     print('Cleaning processing file...')
-    homePath = os.getcwd()
-    os.chdir(procFile)
-    for file in glob.glob('*.csv'):
+    for file in ct.folderFiles(procFile, '*.csv'):
         os.remove(file)
-    os.chdir(homePath)
+    procSnapshots.clear()
     print('Cleaned sucessfully!')
 
-def createGraph(effectedDf):
-    G = nx.Graph()
-    for idx in effectedDf.index:
-        G.add_edge(effectedDf.loc[idx, 'Effected By'],
-                   effectedDf.loc[idx, 'Effected Calc'])
-    """pos = {'A2.2D Copy NATS from Input': (0,0),
-           'A2.3C Shape Quarterly to RF': (1, 1),
-           'A2.3D Forecast Quarterly R0': (1, -1),
-           'A2.7A Calc NATS in Pounds £ms': (2, 0),
-           'A2.14A Calc CAA_TOT': (3, 1),
-           'A2.14L Calc OV_EXP_T': (3, -1),
-           'A2.14O Calc OV_EXP_T VM': (4, 1),
-           'A2.16I Calc EX 3.2.3N1': (4, -1),
-           'A3.2B Copy RF to Adjustment data': (5, 0),
-           'A3.2C Copy R1.1 data': (6, 0),
-           'A3.3A Calc R1.2 data': (7, 0),
-           'A4.3 Copy WIP to WIP': (8, 0)}"""
-    pos = nx.spring_layout(G, k=0.3)
-    nx.draw(G, pos, node_size=200, edge_color='r', alpha=0.4, font_size=12,
-            with_labels=True)
-    plt.show()
-    
-def fillDependancies():
-    for file in glob.glob('*.csv'):
-        if 'External_Datasets_Out_rpt_' not in file: continue
-        tempDf = pd.read_csv(file, skiprows=3)
-        dependanciesDf['Stat Act'] = tempDf['Stat Activity'].tolist()
-        dependanciesDf['Mode'] = tempDf['Mode'].tolist()
-        dependanciesDf['Task Name'] = tempDf['Name'].tolist()
-        dependanciesDf['Effected Dataset'] = tempDf['Dataset'].tolist()
-        for r, source in enumerate(tempDf['Type Specific Details']):
-            dependanciesDf.loc[r, 'Source Dataset'] = source.split('name = ')\
-                [1].split('}')[0].strip()
-        """for r, selCritString in enumerate(tempDf['Selection Criteria']):
-            selCritList = splitCordString(selCritString)
-            for selCrit in selCritList:
-                crit = selCrit.split(' = ')[0].strip()
-                sel = selCrit.split(' = ')[1].strip()"""
-        dependanciesDf['Selection Criteria'] = tempDf['Selection Criteria']
+def impactGraph(effectedDf):
+    """Returns the directed graph of effectedDf, with an edge from each calc
+    to every calc it effects. Nodes carry the calc's Order, Type and Target
+    Dataset where they're known.
+    """
+    import networkx as nx
+    G = nx.DiGraph()
+    for effectedBy, calc in zip(effectedDf['Effected By'],
+                                effectedDf['Effected Calc']):
+        G.add_edge(effectedBy, calc)
+    for node in G.nodes:
+        if node not in taskGrps.columns: continue
+        if pd.notnull(taskGrps.loc['Order', node]):
+            G.nodes[node]['Order'] = float(taskGrps.loc['Order', node])
+        for attr in ['Type', 'Target Dataset']:
+            if pd.notnull(taskGrps.loc[attr, node]):
+                G.nodes[node][attr] = str(taskGrps.loc[attr, node])
+    return G
 
+def layeredLayout(G):
+    """Returns node positions with a column for each calc order, in a single
+    pass over the nodes. Nodes without an order go in the first column.
+    """
+    orders = {node: G.nodes[node].get('Order', -1) for node in G.nodes}
+    columns = {order: c for c, order
+               in enumerate(sorted(set(orders.values())))}
+    layers = {}
+    for node in sorted(G.nodes, key=str):
+        layers.setdefault(columns[orders[node]], []).append(node)
+    pos = {}
+    for x, nodes in layers.items():
+        for y, node in enumerate(nodes):
+            pos[node] = (x, (len(nodes)-1)/2 - y)
+    return pos
+
+def writeDot(G, file):
+    """Writes G to file in Graphviz DOT format.
+    """
+    def quote(text):
+        return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"') + '"'
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('digraph Impacts {\n    rankdir=LR;\n')
+        for node, attrs in G.nodes(data=True):
+            attrStr = ''.join(', ' + quote(k) + '=' + quote(v)
+                              for k, v in attrs.items())
+            f.write('    ' + quote(node) + ' [label=' + quote(node) + attrStr +
+                    '];\n')
+        for src, targ in G.edges:
+            f.write('    ' + quote(src) + ' -> ' + quote(targ) + ';\n')
+        f.write('}\n')
+
+def writeJson(G, file):
+    """Writes G to file as JSON lists of nodes and edges.
+    """
+    data = {'nodes': [dict(attrs, id=node) for node, attrs
+                      in G.nodes(data=True)],
+            'edges': [{'source': src, 'target': targ}
+                      for src, targ in G.edges]}
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, default=str)
+
+def createGraph(effectedDf, name='Impact Graph'):
+    """Saves the impact graph of effectedDf to the OUTPUT folder in each of
+    GRAPH_FORMATS, plus a rendered png using a layered layout if GRAPH_IMAGE
+    is True. Nothing is displayed, so this can run on servers without one.
+    """
+    import networkx as nx
+    G = impactGraph(effectedDf)
+    if G.number_of_nodes() == 0:
+        return G
+    path = os.path.join(outputFile, name)
+    writers = {'graphml': nx.write_graphml, 'dot': writeDot,
+               'json': writeJson}
+    for fmt in GRAPH_FORMATS:
+        try:
+            writers[fmt](G, path + '.' + fmt)
+        except Exception as e:
+            ct.error('Failed to save the impact graph as ' + fmt + '! ' +
+                     str(e), warning=True)
+    if GRAPH_IMAGE:
+        #matplotlib is slow to import, so it's only loaded to draw the png
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        pos = layeredLayout(G)
+        width = max(x for x, y in pos.values()) + 1
+        height = max(abs(y) for x, y in pos.values())*2 + 1
+        fig = plt.figure(figsize=(min(4 + 2.5*width, 200),
+                                  min(3 + 0.6*height, 200)))
+        nx.draw(G, pos, node_size=200, edge_color='r', alpha=0.4,
+                font_size=8, with_labels=True, arrows=True)
+        fig.savefig(path + '.png', bbox_inches='tight')
+        plt.close(fig)
+    return G
+    
 def checkChanges():
     global inCrit
     global outCrit
@@ -738,29 +934,190 @@ def checkChanges():
                 changedList.append(idx)
         outCrit.loc['Changes', calc] = ', '.join(changedList)
 
-def checkDependencies():
+def expandSelections(crit, selStr):
+    """Returns the set of codes in the comma separated selections selStr of
+    crit, with any item groups replaced by their codes.
+    """
+    sels = set()
+    for sel in str(selStr).split(','):
+        sel = sel.strip()
+        if sel[:5] == 'group':
+            grp = crit + ':' + sel[6:].strip()
+            if grp in classGrps.columns:
+                sels.update(classGrps[grp].dropna())
+                continue
+            sel = sel[6:].strip()
+        if sel not in {'', 'nan'}:
+            sels.add(sel)
+    return sels
+
+def dependencyCriteria(impacted, selCrit, dimMaps):
+    """Returns the selection criteria of the data an external dataset
+    dependency copies into its target stat act as a series, where impacted is
+    a dict of the impacted selections of each criteria of its source dataset.
+    Returns None if none of the impacted data is picked up by the dependency.
+    
+    The impacted selections are intersected with the dependency's selection
+    criteria, then passed through its dimension mappings. Indirect mappings
+    are read the same way as in Task Reports (see fillSelCritDfs): data
+    moves from the dimension on the right of the arrow, in the mapping's
+    target codes, to the one on the left, in its source codes.
+    """
+    crits = {crit: set(sels) for crit, sels in impacted.items()}
+    if pd.notnull(selCrit):
+        for item in ct.parseCordString(selCrit):
+            if item.op != '=': continue
+            crit = item.key
+            sels = expandSelections(crit, item.value)
+            if '*' in sels: continue
+            if crit in crits and '*' not in crits[crit]:
+                crits[crit] &= sels
+                if crits[crit] == set():
+                    return None
+            else:
+                crits[crit] = sels
+    if pd.isnull(dimMaps) or str(dimMaps).strip() in {'', 'n/a'}:
+        mapped = crits
+    else:
+        mapped = {}
+        for dimMap in ct.parseCordString(dimMaps):
+            if dimMap.op != '->': continue
+            src = dimMap.key
+            dimType = dimMap.mapType
+            targ = dimMap.value
+            if dimType == 'Direct':
+                mapped[targ] = crits.get(src, {'*'})
+            if dimType == 'Unmapped':
+                mapped[targ] = {src}
+            if dimType == 'Indirect':
+                src, targ = dimMap.value, dimMap.key
+                mapName = str(dimMap.mapping).split(' (from ')[0].strip()
+                if src not in crits or '*' in crits[src]:
+                    mapped[targ] = {'*'}
+                elif mapName not in classMaps:
+                    ct.error('Mapping ' + mapName + ' not found, all of ' + 
+                             targ + ' will be treated as effected.',
+                             warning=True)
+                    mapped[targ] = {'*'}
+                else:
+                    mapped[targ] = set(classMaps[mapName]\
+                                       .unmapCodes(sorted(crits[src])))
+                    if mapped[targ] == set():
+                        return None
+    return pd.Series({crit: ', '.join(sorted(sels))
+                      for crit, sels in mapped.items()}, dtype=object)
+
+def dependencyStarts(impactDf):
+    """Returns the searches needed to follow the dataset impacts in impactDf
+    (as returned by summariseImpacts) into the stat acts that copy them. Each
+    search is a tuple of (stat act, copy calc, dataset, selection criteria,
+    effected by).
+    """
+    starts = []
+    for dataset, datasetDf in impactDf.groupby('Dataset', sort=False):
+        deps = dependanciesDf[dependanciesDf['Source Dataset']==dataset]
+        if deps.empty: continue
+        impacted = {crit: expandSelections(crit, sels) for crit, sels
+                    in zip(datasetDf['Criteria'], datasetDf['Selections'])}
+        for r in deps.index:
+            critSeries = dependencyCriteria(impacted,
+                                            deps.loc[r, 'Selection Criteria'],
+                                            deps.loc[r, 'Dimension Mappings'])
+            if critSeries is None: continue
+            starts.append((str(deps.loc[r, 'Stat Act']).strip(),
+                           str(deps.loc[r, 'Task Name']).strip(),
+                           str(deps.loc[r, 'Effected Dataset']).strip(),
+                           critSeries, curStatAct + ': ' + dataset))
+    return starts
+
+def searchFromDependency(calc, dataset, critSeries):
+    """Runs a search in the loaded stat act starting from the copy calc that
+    picks up data from another stat act. If the calc isn't in the task
+    definition the search starts from the dataset it copies into instead.
+    """
+    if calc in taskGrps.columns:
+        setCalcStart(calc, critSeries)
+        searchEffectedTasks(taskGrps.loc['Target Dataset', calc])
+    elif dataset in datasetCritDf.columns:
+        dims = datasetCritDf[dataset].dropna().tolist()
+        setSelCritStart(dataset, critSeries[critSeries.index.isin(dims)])
+        searchEffectedTasks(dataset)
+    else:
+        raise KeyError('Neither calc ' + calc + ' nor dataset ' + dataset +
+                       ' found in ' + curStatAct + '!')
+    searchLoop()
+
+def searchResults(effectedBy=None, calc=None, impactDf=None):
+    """Returns the effected calcs and dataset impacts of the search just run
+    in the loaded stat act, labelled with the stat act. If calc is given it
+    is added as effected by effectedBy. The dataset impacts are read from the
+    PROCESSING folder unless they are given as impactDf.
+    """
+    resDf = effectedDf.drop(['Searched', 'Order'], axis=1, errors='ignore')
+    if calc is not None:
+        resDf = pd.concat([pd.DataFrame({'Effected Calc': [calc],
+                                         'Effected By': [effectedBy]}),
+                           resDf], ignore_index=True)
+    resDf.insert(0, 'Stat Act', curStatAct)
+    if impactDf is None:
+        impactDf = summariseImpacts(readProcessing())
+    impactDf = impactDf.copy()
+    impactDf.insert(0, 'Stat Act', curStatAct)
+    return resDf, impactDf
+
+def propagateImpacts(impactDf=None):
+    """Follows the impacts of the search just run through External Datasets
+    into every stat act that picks up the impacted data, and on from there.
+    Stat act models are only loaded once the trace reaches them.
+    
+    Returns the effected calcs and dataset impacts of every stat act reached,
+    including the one the search started in, which is reloaded afterwards.
+    If the impacts of the search just run are already known they can be given
+    as impactDf.
+    """
+    homeAct = curStatAct
+    resDf, impactDf = searchResults(impactDf=impactDf)
+    effectedList = [resDf]
+    impactList = [impactDf]
+    pending = dependencyStarts(impactDf)
+    seen = set()
+    while pending != []:
+        statAct, calc, dataset, critSeries, effectedBy = pending.pop(0)
+        key = (statAct, calc, dataset, canonCriteria(critSeries))
+        if key in seen: continue
+        seen.add(key)
+        print('Following impacts into', statAct, 'through', calc, '...')
+        if not switchStatAct(statAct): continue
+        resetSearch()
+        try:
+            searchFromDependency(calc, dataset, critSeries)
+        except KeyError as e:
+            ct.error(str(e), warning=True)
+            continue
+        resDf, impactDf = searchResults(effectedBy, calc)
+        effectedList.append(resDf)
+        impactList.append(impactDf)
+        pending.extend(dependencyStarts(impactDf))
+    switchStatAct(homeAct)
+    return (pd.concat(effectedList, ignore_index=True),
+            pd.concat(impactList, ignore_index=True))
+
+def checkDependencies(impactDf=None):
+    """Follows the impacts of the search into other stat acts and saves what
+    they effect to Stat Act Impacts.xlsx in the OUTPUT folder. impactDf can
+    be the dataset impacts returned by fillImpactedDfs.
+    """
     print('Checking dependancies...')
-    os.chdir(outputFile)
-    impactedDfList = []
-    impactFile = pd.ExcelFile('Dataset Impacts.xlsx')
-    for sheet in impactFile.sheet_names:
-        df = impactFile.parse(sheet)
-        df.loc[0, 'Dataset Name'] = sheet.strip()
-        impactedDfList.append(df)
-    overlap = list(set(impactFile.sheet_names) ^ \
-            set(dependanciesDf['Effected Dataset']))
-    if overlap != []:
-        for impactedDf in overlap:
-            for df in impactedDfList:
-                if df.loc[0, 'Dataset Name'] != impactedDf: continue
-                #df.drop('Dataset Name', axis=1, inplace=True)
-                #Need to compare selection criteria between the impactedDf and
-                #each of the rows in dependenciesDf that pick up data from the
-                #impactedDf. If they share criteria, then that business area
-                #will be effected.
-                """critSeries
-                for c in df.columns:
-                    (', ').join(df[c].dropna().tolist())"""
+    resDf, impactDf = propagateImpacts(impactDf)
+    if (resDf['Stat Act'] != curStatAct).any():
+        with pd.ExcelWriter(os.path.join(outputFile,
+                                         'Stat Act Impacts.xlsx'),
+                            engine='xlsxwriter') as writer:
+            resDf.to_excel(writer, sheet_name='Effected Calcs', index=False)
+            impactDf.to_excel(writer, sheet_name='Dataset Impacts',
+                              index=False)
+    else:
+        print('No other stat acts are effected.')
     print('Dependencies checked!')
 
 def mode():
@@ -768,15 +1125,152 @@ def mode():
     print('Which mode would you like to run in?')
     print('1. Search via selection criteria')
     print('2. Search via calc')
+    print('3. Run a batch of searches from a query file')
+    print('4. Find what feeds a dataset')
     selMode = 99999
-    while selMode not in {1,2}:
+    while selMode not in {1,2,3,4}:
         selMode = input('Enter the number of your selected mode: ')
         selMode = int(selMode)
-        if selMode not in {1,2}:
+        if selMode not in {1,2,3,4}:
             ct.error('Unrecognised Mode!')
     return selMode
     
+def checkpointPath():
+    """Returns the filepath of the search checkpoint in the PROCESSING folder.
+    """
+    return os.path.join(procFile, 'ImpactTracer.ckpt')
+
+def processingSnapshot():
+    """Returns the contents of the PROCESSING csvs as a dict by file name.
+    Files are only read again if they've changed since the last snapshot.
+    """
+    snapshot = {}
+    for file in glob.glob(os.path.join(procFile, '*.csv')):
+        name = os.path.basename(file)
+        stat = os.stat(file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if name not in procSnapshots or procSnapshots[name][0] != stamp:
+            with open(file, 'r', encoding='utf-8') as f:
+                procSnapshots[name] = (stamp, f.read())
+        snapshot[name] = procSnapshots[name][1]
+    return snapshot
+
+def checkpointState():
+    """Returns the state of the search in the loaded stat act as a dict,
+    along with a snapshot of the PROCESSING csvs as they are now.
+    """
+    state = {'Version': CHECKPOINT_VERSION, 'Stat Act': curStatAct,
+             'Time': datetime.datetime.now(),
+             'effectedDf': effectedDf.copy(),
+             'targetCalcSelCrit': targetCalcSelCrit,
+             'calcOrderNo': calcOrderNo,
+             'curAffectingCalc': curAffectingCalc,
+             'stepStats': list(stepStats), 'Defined': None,
+             'Processing': processingSnapshot()}
+    if 'Defined Selection Criteria' in taskGrps.columns:
+        state['Defined'] = taskGrps['Defined Selection Criteria'].copy()
+    return state
+
+def saveCheckpoint(state):
+    """Saves state, as returned by checkpointState, to the checkpoint file.
+    """
+    tmpFile = checkpointPath() + '.tmp'
+    with gzip.open(tmpFile, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpFile, checkpointPath())
+
+def loadCheckpoint():
+    """Returns the state saved in the checkpoint file, or None if there isn't
+    a usable one.
+    """
+    if not os.path.exists(checkpointPath()):
+        return None
+    try:
+        with gzip.open(checkpointPath(), 'rb') as f:
+            state = pickle.load(f)
+    except Exception as e:
+        ct.error('Unable to read search checkpoint. ' + str(e), warning=True)
+        return None
+    if state.get('Version') != CHECKPOINT_VERSION:
+        return None
+    return state
+
+def clearCheckpoint():
+    """Deletes the checkpoint file, if there is one.
+    """
+    if os.path.exists(checkpointPath()):
+        os.remove(checkpointPath())
+
+def restoreCheckpoint(state):
+    """Puts the search back to the state saved in a checkpoint. The model of
+    the checkpoint's stat act must already be loaded.
+    """
+    global effectedDf
+    global targetCalcSelCrit
+    global calcOrderNo
+    global curAffectingCalc
+    global stepStats
+    delProcessing()
+    for file, text in state['Processing'].items():
+        with open(os.path.join(procFile, file), 'w', encoding='utf-8') as f:
+            f.write(text)
+    effectedDf = state['effectedDf']
+    targetCalcSelCrit = state['targetCalcSelCrit']
+    calcOrderNo = state['calcOrderNo']
+    curAffectingCalc = state['curAffectingCalc']
+    stepStats = state['stepStats']
+    if state['Defined'] is not None:
+        taskGrps['Defined Selection Criteria'] = state['Defined']
+    print('Resumed search with', len(stepStats), 'steps done and',
+          (effectedDf['Searched']==False).sum(), 'queued.')
+
 def searchLoop():
+    """Runs propagation steps until every effected calc has been searched.
+    
+    Only the top level search, the first run in checkpointAct, is
+    checkpointed every CHECKPOINT_EVERY seconds and when interrupted, so it
+    can be resumed. Searches propagated into other stat acts, or back into
+    checkpointAct, are not. The state saved is always from the end of the
+    last completed step, along with the PROCESSING csvs at that point.
+    """
+    global lastState
+    global lastSave
+    global topSearch
+    global checkpointSearch
+    checkpointing = CHECKPOINT_EVERY is not None and topSearch and \
+                    curStatAct == checkpointAct
+    topSearch = False
+    outerSearch = checkpointSearch
+    checkpointSearch = checkpointing
+    lastState = checkpointState() if checkpointing else None
+    lastSave = time.perf_counter()
+    try:
+        searchSteps()
+        if checkpointing:
+            saveCheckpoint(checkpointState())
+    except KeyboardInterrupt:
+        if checkpointing:
+            saveCheckpoint(lastState)
+            print('\nSearch interrupted! Progress saved, run again to resume.')
+        raise
+    finally:
+        checkpointSearch = outerSearch
+
+def checkpointStep():
+    """Keeps the state at the end of a propagation step, saving it to the
+    checkpoint file if CHECKPOINT_EVERY seconds have passed since the last
+    save.
+    """
+    global lastState
+    global lastSave
+    if not checkpointSearch:
+        return
+    lastState = checkpointState()
+    if time.perf_counter() - lastSave >= CHECKPOINT_EVERY:
+        saveCheckpoint(lastState)
+        lastSave = time.perf_counter()
+
+def searchSteps():
     global targetCalcSelCrit
     global calcOrderNo
     global curAffectingCalc
@@ -788,7 +1282,7 @@ def searchLoop():
         searchedFalseIdxs = effectedDf.index[effectedDf['Searched']==False]
         c = min(searchedFalseIdxs.tolist())
         calc = effectedDf.loc[c, 'Effected Calc']
-        print('Running search task for', calc,'...')
+        startStep(calc)
         curAffectingCalc = calc
         calcOrderNo = taskGrps.loc['Order', calc]
         #if outCrit.loc['Changes', calc] != np.nan:
@@ -796,7 +1290,9 @@ def searchLoop():
         for cic, ci in enumerate(changed):
             changed[cic] = ci.strip()
         effectingCalc = effectedDf.loc[c, 'Effected By']
+        start = time.perf_counter()
         effectingTargDf = readTargSelCrit(effectingCalc)
+        addTime('IO', start)
         targDataset = taskGrps.loc['Target Dataset', calc]
         effectingTargDf = effectingTargDf.drop('Target Dataset', axis=1)
         #print(effectingTargDf)
@@ -837,14 +1333,13 @@ def searchLoop():
                                            'Searched'], inplace=True)
         effectedDf.reset_index(drop=True, inplace=True)
         #print(effectedDf)
-        print(str(c+1) + '/' + str(len(effectedDf.index)))
+        endStep(targetCalcSelCrit, (effectedDf['Searched']==False).sum())
+        checkpointStep()
 
-def searchBySelCrit():
-    global targetCalcSelCrit
-    global calcOrderNo
-    global curAffectingCalc
-    calcOrderNo = 0
-    #critList = [x for x in taskGrps.index.tolist() if x not in dropCols]
+def askDatasetCriteria():
+    """Asks for a dataset and the selections of each of its criteria. Returns
+    the dataset and a series of the selections.
+    """
     for i, opt in enumerate(datasetCritDf.columns.tolist()):
         print(str(i)+'.', opt)
     dOpt = 999999
@@ -853,7 +1348,6 @@ def searchBySelCrit():
         dOpt = input('Enter number corresponding to the desired dataset: ')
         dOpt = int(dOpt)
     dataset = datasetCritDf.columns[dOpt]
-    taskGrps.loc['Target Dataset', 'Defined Selection Criteria'] = dataset
     print('Please enter the selections for each criteria.')
     print('If there is more than one selection, seperate it with a comma and',
           'a space.')
@@ -871,16 +1365,16 @@ def searchBySelCrit():
                 print(idx, '=', selCritDf.loc[idx,
                                               'Defined Selection Criteria'])
         cont = input('Are these criteria correct? Enter Y to confirm: ')
-    
-    for idx in selCritDf.index:
-        taskGrps.loc[idx, 'Defined Selection Criteria'] = selCritDf.loc[idx,
-                    'Defined Selection Criteria']
-    #selCritDf.loc['Target Dataset', 'Defined Selection Criteria'] = dataset
-    #print(dataset)
-    curAffectingCalc = 'Defined Selection Criteria'
-    targetCalcSelCrit = permuteCriteria(selCritDf\
-                                        ['Defined Selection Criteria'],
-                                        target=True)
+    return dataset, selCritDf['Defined Selection Criteria']
+
+def searchBySelCrit():
+    global targetCalcSelCrit
+    global calcOrderNo
+    global curAffectingCalc
+    calcOrderNo = 0
+    #critList = [x for x in taskGrps.index.tolist() if x not in dropCols]
+    dataset, critSeries = askDatasetCriteria()
+    setSelCritStart(dataset, critSeries)
     searchEffectedTasks(dataset)
     searchLoop()
 
@@ -895,49 +1389,667 @@ def searchByCalc():
     searchEffectedTasks(taskGrps.loc['Target Dataset', curAffectingCalc])
     searchLoop()
 
-def runTask():
+@lru_cache(maxsize=65536)
+def intersectCriteria(canonA, canonB):
+    """Returns the canonical selection criteria covered by both canonA and
+    canonB, where criteria selected as * match anything and criteria missing
+    from one are taken from the other. Returns None if they share a criteria
+    with no selections in common.
+    """
+    inter = dict(canonA)
+    for crit, sels in canonB:
+        if crit not in inter or '*' in inter[crit]:
+            inter[crit] = sels
+        elif '*' not in sels:
+            inter[crit] = inter[crit] & sels
+            if inter[crit] == frozenset():
+                return None
+    return tuple(sorted(inter.items()))
+
+def feedingCalcs(dataset, orderNo, targCanon):
+    """Returns the calcs before orderNo that write data described by the
+    canonical criteria targCanon to dataset. Criteria missing from targCanon
+    are treated as *. Results are kept in matchCache alongside the forward
+    propagation steps.
+    """
+    key = ('Feeds', dataset, orderNo, targCanon)
+    if key in matchCache:
+        return matchCache[key]
+    matched = []
+    for calc in outCrit.columns:
+        if calc == 'Defined Selection Criteria': continue
+        if taskGrps.loc['Order', calc] >= orderNo: continue
+        if taskGrps.loc['Target Dataset', calc] != dataset: continue
+        outCanon = canonCriteria(outCrit[calc].drop('Changes',
+                                                    errors='ignore'))
+        if intersectCriteria(outCanon, targCanon) is not None:
+            matched.append(calc)
+    matchCache[key] = matched
+    return matched
+
+def feedCriteria(calc, targCanon):
+    """Returns the canonical criteria of the data calc reads to produce the
+    data described by targCanon, or None if it reads none of it. Criteria the
+    calc changes are replaced by its input criteria, the rest are narrowed by
+    them.
+    """
+    changed = {crit.strip() for crit in
+               str(outCrit.loc['Changes', calc]).split(',')}
+    passed = tuple((crit, sels) for crit, sels in targCanon
+                   if crit not in changed)
+    return intersectCriteria(canonCriteria(inCrit[calc]), passed)
+
+def canonString(canon):
+    """Returns canonical selection criteria as a CORD style string.
+    """
+    return ''.join('{' + crit + ' = ' + ', '.join(sorted(sels)) + '}'
+                   for crit, sels in canon)
+
+def searchFeeds(dataset, critSeries):
+    """Walks backwards from the data in dataset described by critSeries and
+    returns a dataframe of every calc, import and external source that can
+    feed it, with the criteria it is restricted to at each hop. Branches whose
+    criteria don't intersect are pruned. Copies from other stat acts are
+    followed into them, loading their models as needed.
+    """
+    homeAct = curStatAct
+    rows = []
+    pending = [(curStatAct, dataset, float('inf'), canonCriteria(critSeries),
+                'Searched Data')]
+    seen = set()
+    while pending != []:
+        statAct, dataset, orderNo, canon, feeds = pending.pop(0)
+        if (statAct, dataset, orderNo, canon) in seen: continue
+        seen.add((statAct, dataset, orderNo, canon))
+        if not switchStatAct(statAct):
+            rows.append([statAct, dataset, 'External', np.nan, dataset,
+                         np.nan, feeds, canonString(canon)])
+            continue
+        calcs = feedingCalcs(dataset, orderNo, canon)
+        #Data no calc writes must already be in the dataset when the task runs
+        if calcs == []:
+            rows.append([statAct, dataset, 'Import', np.nan, dataset, np.nan,
+                         feeds, canonString(canon)])
+            continue
+        for calc in calcs:
+            hopCanon = feedCriteria(calc, canon)
+            if hopCanon is None: continue
+            srcData = taskGrps.loc['Source Dataset', calc]
+            rows.append([statAct, calc, taskGrps.loc['Type', calc],
+                         taskGrps.loc['Order', calc], dataset, srcData, feeds,
+                         canonString(hopCanon)])
+            srcAct = statAct
+            objDets = taskGrps.loc['Obj Dets', calc]
+            if pd.isnull(srcData):
+                srcData = dataset
+            elif '(from ' in objDets:
+                srcAct = objDets.split('(from ')[1].split(')')[0].strip()
+            if srcAct != statAct:
+                pending.append((srcAct, srcData, float('inf'), hopCanon,
+                                calc))
+            else:
+                pending.append((statAct, srcData, taskGrps.loc['Order', calc],
+                                hopCanon, calc))
+    switchStatAct(homeAct)
+    return pd.DataFrame(rows, columns=['Stat Act', 'Feeding Calc', 'Type',
+                                       'Order', 'Target Dataset',
+                                       'Source Dataset', 'Feeds',
+                                       'Criteria'])
+
+def searchByFeeds():
+    """Asks for a dataset and criteria and saves everything that feeds it to
+    Feeds.xlsx in the OUTPUT folder.
+    """
+    dataset, critSeries = askDatasetCriteria()
+    feedDf = searchFeeds(dataset, critSeries)
+    print(feedDf)
+    try:
+        feedDf.to_excel(os.path.join(outputFile, 'Feeds.xlsx'), index=False,
+                        sheet_name='Feeds')
+    except:
+        ct.error('Failed to save Feeds!')
+
+def getModel():
+    """Returns the structures that make up the loaded impact model as a dict.
+    """
+    return {key: globals()[key] for key in MODEL_KEYS}
+
+def setModel(model):
+    """Replaces the loaded impact model with the structures in model.
+    """
+    global matchCache
+    globals().update({key: model[key] for key in MODEL_KEYS})
+    matchCache = {}
+
+def indexPath(zips, taskAct=''):
+    """Returns the filepath of the impact index of taskAct for the given
+    source zips. The filename is keyed by the index version, the stat act and
+    the hash of every zip, so any change to the source reports or the index
+    layout gives a new index.
+    """
+    sha = hashlib.sha1(('v' + str(INDEX_VERSION) + taskAct).encode())
+    for file in sorted(zips):
+        sha.update(zipHash(file).encode())
+    return os.path.join(ct.cacheFolder(inputFile),
+                        'ImpactIndex_' + sha.hexdigest() + '.pkl')
+
+def latestIndexPath(taskAct):
+    """Returns the filepath of the file naming the last impact index saved for
+    taskAct.
+    """
+    return os.path.join(ct.cacheFolder(inputFile), 'ImpactLatest_' +
+                        hashlib.sha1(taskAct.encode()).hexdigest() + '.txt')
+
+def saveIndex(path, taskAct=None):
+    """Saves the loaded impact model and its match cache to the impact index
+    at path. If taskAct is given the index is recorded as its latest.
+    """
+    global savedCacheSize
+    print('Saving impact index...')
+    ct.savePickle({'Version': INDEX_VERSION, 'Model': getModel(),
+                   'Match Cache': matchCache}, path)
+    savedCacheSize = len(matchCache)
+    if taskAct is not None:
+        with open(latestIndexPath(taskAct), 'w') as f:
+            f.write(os.path.basename(path))
+
+def readIndex(path):
+    """Returns the contents of the impact index at path, or None if there is
+    no usable index.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+    except Exception as e:
+        ct.error('Unable to read impact index, rebuilding. ' + str(e),
+                 warning=True)
+        return None
+    if index.get('Version') != INDEX_VERSION:
+        return None
+    return index
+
+def loadIndex(path):
+    """Loads the impact model and its match cache from the impact index at
+    path. Returns False if there is no usable index.
+    """
+    global matchCache
+    global savedCacheSize
+    index = readIndex(path)
+    if index is None:
+        return False
+    setModel(index['Model'])
+    matchCache = index.get('Match Cache', {})
+    savedCacheSize = len(matchCache)
+    print('Impact index loaded!')
+    return True
+
+def previousIndex(taskAct):
+    """Returns the contents of the last impact index saved for taskAct, or
+    None if there isn't a usable one.
+    """
+    if not os.path.exists(latestIndexPath(taskAct)):
+        return None
+    with open(latestIndexPath(taskAct), 'r') as f:
+        name = f.read().strip()
+    return readIndex(os.path.join(ct.cacheFolder(inputFile), name))
+
+def pruneCache(zips):
+    """Deletes the partitions and impact indexes in the INPUT folder's cache
+    that don't belong to the zips in it at the current INDEX_VERSION. The
+    latest index of each stat act in zips is kept, so it can still be
+    refilled from, while those of stat acts no longer there are removed.
+    """
+    cacheFol = ct.cacheFolder(inputFile)
+    acts = taskActs(zips) + ['']
+    keep = {os.path.basename(partitionPath(zipFile, act))
+            for zipFile in zips for act in acts}
+    keep |= {os.path.basename(indexPath(zips, act)) for act in acts}
+    latestFiles = {latestIndexPath(act) for act in acts}
+    for file in glob.glob(os.path.join(cacheFol, 'ImpactLatest_*.txt')):
+        try:
+            if file in latestFiles:
+                with open(file, 'r') as f:
+                    keep.add(f.read().strip())
+            else:
+                os.remove(file)
+        except OSError:
+            pass
+    removed = 0
+    for pattern in ['Partition_*.pkl', 'ImpactIndex_*.pkl']:
+        for file in glob.glob(os.path.join(cacheFol, pattern)):
+            if os.path.basename(file) in keep: continue
+            try:
+                os.remove(file)
+                removed += 1
+            except OSError:
+                pass
+    if removed > 0:
+        print('Removed', removed, 'out of date files from the cache.')
+
+def saveMatchCache():
+    """Saves the loaded model's index again if searches have added to its
+    match cache, so later runs can reuse them.
+    """
+    if curIndex is not None and len(matchCache) > savedCacheSize:
+        if 'Defined Selection Criteria' in taskGrps.columns:
+            del taskGrps['Defined Selection Criteria']
+        saveIndex(curIndex)
+
+def buildModel(zips, taskAct, prevIndex=None):
+    """Unpacks the Config and Task Reports straight from their zips to build
+    the impact model. Reports are only read for zips that have changed since
+    they were last read. If the previous index of taskAct is given as
+    prevIndex, only the calcs whose fingerprints have changed are refilled
+    and its match cache is kept for the parts of the task that haven't
+    changed.
+    """
+    global matchCache
+    global calcPrints
+    matchCache = {}
+    mergeIngestion(ingestPartitions(zips, taskAct))
+    prints = calcFingerprints()
+    if prevIndex is None:
+        fillSelCritDfs()
+    else:
+        updateSelCritDfs(prevIndex, prints)
+    calcPrints = prints
+    checkChanges()
+
+def modelDigests():
+    """Returns a digest of the codes, groups, hierarchy and mappings held for
+    each classification and mapping name in the model.
+    """
+    shas = {}
+    def update(name, *parts):
+        shas.setdefault(name, hashlib.sha1()).update(repr(parts).encode())
+    for clas in classifications.columns:
+        update(clas, classifications[clas].dropna().tolist())
+    for grp in classGrps.columns:
+        update(grp.split(':')[0], grp, classGrps[grp].dropna().tolist())
+    for clas, hierarchy in hierarchies.items():
+        update(clas, sorted(hierarchy.children.items()))
+    for name, mapping in classMaps.items():
+        update(name, sorted(mapping.forward.items()))
+    return {name: sha.digest() for name, sha in shas.items()}
+
+def calcFingerprints():
+    """Returns a fingerprint of each calc in taskGrps, covering its task
+    definition and every classification or mapping it mentions. A calc whose
+    fingerprint hasn't changed will have the same selection criteria.
+    """
+    digests = modelDigests()
+    prints = {}
+    for calc in taskGrps.columns:
+        text = repr([(idx, str(val)) for idx, val in taskGrps[calc].items()
+                     if pd.notnull(val)])
+        sha = hashlib.sha1(text.encode())
+        for name, digest in digests.items():
+            if name in text:
+                sha.update(digest)
+        prints[calc] = sha.hexdigest()
+    return prints
+
+def updateSelCritDfs(prevIndex, prints):
+    """Fills the selection criteria of the calcs whose fingerprints differ
+    from those in prevIndex, reusing the previous criteria of the rest. Match
+    cache entries for datasets no changed calc reads or writes are kept.
+    """
+    global inCrit
+    global outCrit
+    global undroppable
+    global matchCache
+    prevModel = prevIndex['Model']
+    prevPrints = prevModel['calcPrints']
+    prevIn = prevModel['inCrit']
+    unchanged = [calc for calc in taskGrps.columns
+                 if prevPrints.get(calc) == prints[calc]]
+    #Unchanged calcs missing from the previous criteria were skipped checks
+    for calc in unchanged:
+        if calc not in prevIn.columns:
+            del taskGrps[calc]
+    unchanged = [calc for calc in unchanged if calc in prevIn.columns]
+    changed = [calc for calc in taskGrps.columns if calc not in unchanged]
+    print('Refilling selection criteria for', len(changed), 'of',
+          len(taskGrps.columns), 'calcs...')
+    fillSelCritDfs(changed)
+    frames = {'inCrit': inCrit, 'outCrit': outCrit,
+              'undroppable': undroppable}
+    for key, newDf in frames.items():
+        prevDf = prevModel[key][unchanged].drop('Changes', errors='ignore')
+        rows = list(dict.fromkeys(newDf.index.tolist() +
+                                  prevDf.index.tolist()))
+        cols = [calc for calc in taskGrps.columns if calc in newDf.columns
+                or calc in prevDf.columns]
+        frames[key] = pd.concat([prevDf, newDf], axis=1)\
+            .reindex(index=rows, columns=cols)
+    inCrit = frames['inCrit'].fillna('nan')
+    outCrit = frames['outCrit'].fillna('nan')
+    undroppable = frames['undroppable']
+    prevGrps = prevModel['taskGrps']
+    removed = [calc for calc in prevPrints if calc not in taskGrps.columns]
+    touched = set()
+    for grps, calcs in [(taskGrps, changed), (prevGrps, changed + removed)]:
+        for calc in calcs:
+            if calc not in grps.columns: continue
+            touched.update([grps.loc['Source Dataset', calc],
+                            grps.loc['Target Dataset', calc]])
+    matchCache = {key: matched for key, matched
+                  in prevIndex.get('Match Cache', {}).items()
+                  if (key[1] if key[0] == 'Feeds' else key[0]) not in touched}
+
+def inputZips():
+    """Returns the names of the report zips in the INPUT folder.
+    """
+    return [os.path.basename(path) for path in
+            ct.folderFiles(inputFile, '*.zip')]
+
+def taskActs(zips):
+    """Returns the sorted list of stat acts with a Task Report in zips.
+    """
+    return sorted({os.path.basename(file).split('_Task_Report_')[0]
+                   for file in zips if '_Task_Report_' in file})
+
+def loadStatAct(zips, taskAct):
+    """Loads the model of taskAct from its impact index, building and saving
+    the index first if there isn't a usable one.
+    """
+    global curStatAct
+    global curIndex
+    index = indexPath(zips, taskAct)
+    if not loadIndex(index):
+        buildModel(zips, taskAct, previousIndex(taskAct))
+        saveIndex(index, taskAct)
+        pruneCache(zips)
+    curStatAct = taskAct
+    curIndex = index
+
+def switchStatAct(statAct):
+    """Makes statAct the loaded model, loading it the first time it's needed.
+    Models already visited, and their propagation caches, are kept in
+    statActModels. Returns False if statAct has no Task Report.
+    """
+    global matchCache
+    global curStatAct
+    global curIndex
+    global savedCacheSize
+    if statAct == curStatAct:
+        return True
+    zips = inputZips()
+    if statAct not in statActModels and statAct not in taskActs(zips):
+        ct.error('No Task Report found for ' + statAct + ', its impacts ' +
+                 'can not be traced.', warning=True)
+        return False
+    statActModels[curStatAct] = (getModel(), matchCache, curIndex,
+                                 savedCacheSize)
+    if statAct in statActModels:
+        model, cache, index, cacheSize = statActModels[statAct]
+        setModel(model)
+        matchCache = cache
+        curStatAct = statAct
+        curIndex = index
+        savedCacheSize = cacheSize
+    else:
+        print('Loading', statAct, '...')
+        loadStatAct(zips, statAct)
+    return True
+
+def chooseStatAct(acts):
+    """Asks which of the stat acts in acts to start the search from.
+    """
+    for i, opt in enumerate(acts):
+        print(str(i)+'.', opt)
+    aOpt = -1
+    print('Which stat act would you like to start the search from?')
+    while aOpt >= len(acts) or aOpt < 0:
+        aOpt = int(input('Enter number corresponding to the desired stat ' +
+                         'act: '))
+    return acts[aOpt]
+
+def resetSearch():
+    """Clears the results of any previous search so a new one can be run
+    against the loaded model.
+    """
+    global effectedDf
+    effectedDf = pd.DataFrame(columns=['Effected Calc', 'Effected By',
+                                       'Searched'])
+    if 'Defined Selection Criteria' in taskGrps.columns:
+        del taskGrps['Defined Selection Criteria']
+    delProcessing()
+
+def readProcessing():
+    """Reads every target selection criteria csv in the PROCESSING folder into
+    a single dataframe.
+    """
+    dfs = []
+    for file in glob.glob(os.path.join(procFile, '*.csv')):
+        df = pd.read_csv(file, engine='python', dtype=str)
+        df['Target Dataset'] = df['Target Dataset'].replace(np.nan,
+          df.loc[0, 'Target Dataset'])
+        dfs.append(df)
+    if dfs == []:
+        return pd.DataFrame(columns=['Target Dataset'])
+    return pd.concat(dfs, ignore_index=True)
+
+def impactSelections(combinedDf):
+    """Returns the unique impacted selections in combinedDf as a long
+    dataframe of Target Dataset, Criteria and Selections. Only criteria that
+    are dimensions of the dataset are kept.
+    """
+    longDf = combinedDf.melt(id_vars='Target Dataset', var_name='Criteria',
+                             value_name='Selections')
+    longDf = longDf.dropna().drop_duplicates()
+    dims = [(dataset, dim) for dataset in datasetCritDf.columns
+            for dim in datasetCritDf[dataset].dropna()]
+    isDim = pd.MultiIndex.from_frame(longDf[['Target Dataset', 'Criteria']])\
+        .isin(dims)
+    return longDf[isDim]
+
+def joinSelections(longDf):
+    """Joins the selections of each dataset and criteria in longDf, as
+    returned by impactSelections, into one string.
+    """
+    summaryDf = longDf.groupby(['Target Dataset', 'Criteria'], sort=False)\
+        ['Selections'].agg(', '.join).reset_index()
+    return summaryDf.rename(columns={'Target Dataset': 'Dataset'})
+
+def summariseImpacts(combinedDf):
+    """Returns the impacted selections of each criteria for every dataset in
+    combinedDf as a long dataframe, with the selections of each criteria
+    joined into one string.
+    """
+    return joinSelections(impactSelections(combinedDf))
+
+def readQueries(queryFile):
+    """Reads a batch query file. This is a csv with the columns:
+        - Query: Name used to label the results of the query.
+        - Mode: 'Selection Criteria' to start from a dataset, 'Calc' to
+                start from a calc, or 'Feeds' to find what feeds a dataset.
+        - Start: The dataset or calc name to start from.
+        - Criteria: The selection criteria in CORD format, eg 
+                    {Prices = CP}{Sector = S.1, S.11}. Criteria that aren't
+                    given are left blank for datasets, or * for calcs.
+    """
+    queries = pd.read_csv(queryFile, dtype=str, keep_default_na=False)
+    for col in ['Query', 'Mode', 'Start', 'Criteria']:
+        if col not in queries.columns:
+            ct.error('Batch query file is missing the column "'+col+'".')
+            sys.exit(1)
+    for r in queries.index:
+        if queries.loc[r, 'Query'].strip() == '':
+            queries.loc[r, 'Query'] = str(r+1)
+    return queries
+
+def queryCriteria(critStr, crits, default):
+    """Returns a series of the selections given in the CORD string critStr
+    for each criteria in crits, using default for criteria not given.
+    """
+    critSeries = pd.Series(default, index=crits, dtype=object)
+    if critStr.strip() == '':
+        return critSeries
+    for item in ct.parseCordString(critStr):
+        if item.op != '=': continue
+        crit = item.key
+        sel = item.value
+        if crit not in critSeries.index:
+            ct.error(crit + ' is not a criteria of the query start, it will ' +
+                     'be ignored.', warning=True)
+            continue
+        critSeries[crit] = sel
+    return critSeries
+
+def runQuery(mode, start, critStr):
+    """Runs a single search against the loaded model.
+    """
+    if mode.strip().lower() == 'calc':
+        if start not in taskGrps.columns:
+            raise KeyError('Calculation ' + start + ' not found in task ' +
+                           'definition!')
+        crits = [idx for idx in outCrit[start].index
+                 if idx != 'Changes' and outCrit.loc[idx, start] != 'nan']
+        setCalcStart(start, queryCriteria(critStr, crits, '*'))
+        searchEffectedTasks(taskGrps.loc['Target Dataset', start])
+    else:
+        if start not in datasetCritDf.columns:
+            raise KeyError('Dataset ' + start + ' not found!')
+        crits = datasetCritDf[start].dropna().tolist()
+        setSelCritStart(start, queryCriteria(critStr, crits, ''))
+        searchEffectedTasks(start)
+    searchLoop()
+
+def runQueries(queryFile):
+    """Runs every query in queryFile against the loaded model and saves the
+    combined results to Batch Impacts.xlsx in the OUTPUT folder.
+    
+    Matches found by earlier queries are reused by later ones through
+    matchCache, so overlapping queries only pay for their new work. Impacts
+    are followed into other stat acts as in checkDependencies.
+    """
+    queries = readQueries(queryFile)
+    effectedList = []
+    impactList = []
+    feedList = []
+    for r in queries.index:
+        query = queries.loc[r, 'Query']
+        print('Running query', query, '(' + str(r+1) + '/' +
+              str(len(queries.index)) + ')...')
+        resetSearch()
+        if queries.loc[r, 'Mode'].strip().lower() == 'feeds':
+            start = queries.loc[r, 'Start'].strip()
+            if start not in datasetCritDf.columns:
+                ct.error('Query ' + query + ' failed! Dataset ' + start +
+                         ' not found!')
+                continue
+            feedDf = searchFeeds(start, queryCriteria(queries.loc[r,
+                                 'Criteria'], datasetCritDf[start].dropna()\
+                                 .tolist(), ''))
+            feedDf.insert(0, 'Query', query)
+            feedList.append(feedDf)
+            continue
+        try:
+            runQuery(queries.loc[r, 'Mode'], queries.loc[r, 'Start'].strip(),
+                     queries.loc[r, 'Criteria'])
+        except Exception as e:
+            ct.error('Query ' + query + ' failed! ' + str(e))
+            continue
+        queryDf, impactDf = propagateImpacts()
+        queryDf.insert(0, 'Query', query)
+        effectedList.append(queryDf)
+        impactDf.insert(0, 'Query', query)
+        impactList.append(impactDf)
+    if effectedList == [] and feedList == []:
+        ct.error('No queries ran successfully, nothing to save.')
+        return
+    with pd.ExcelWriter(os.path.join(outputFile, 'Batch Impacts.xlsx'),
+                        engine='xlsxwriter') as writer:
+        if effectedList != []:
+            pd.concat(effectedList, ignore_index=True).to_excel(writer,
+                     index=False, sheet_name='Effected Calcs')
+            pd.concat(impactList, ignore_index=True).to_excel(writer,
+                     index=False, sheet_name='Dataset Impacts')
+        if feedList != []:
+            pd.concat(feedList, ignore_index=True).to_excel(writer,
+                     index=False, sheet_name='Feeds')
+    cacheStats()
+    searchProfile()
+    saveMatchCache()
+
+def resumeCheckpoint():
+    """Returns the state of an unfinished search if there is one and the user
+    chooses to resume it, otherwise None.
+    """
+    state = loadCheckpoint()
+    if state is None:
+        return None
+    print('An unfinished search of', state['Stat Act'], 'from',
+          state['Time'].strftime('%d-%m-%Y %H:%M:%S'), 'was found.')
+    if input('Enter Y to resume it or anything else to start a new ' +
+             'search: ').strip().upper() != 'Y':
+        return None
+    return state
+
+def runTask(queryFile=None, taskAct=None, inp=None, proc=None, out=None):
+    """Runs the Impact Tracer, asking which search to run unless a batch
+    query csv is given as queryFile. The INPUT, PROCESSING and OUTPUT folders
+    set up when the script is run can be replaced with inp, proc and out.
+    """
+    global inputFile, procFile, outputFile
     global targetCalcSelCrit
     global calcOrderNo
     global effectedDf
     global curAffectingCalc
     global roundCount
-    dirs = list(filter(os.path.isdir, os.listdir()))
+    global statActModels
+    global stepStats
+    global checkpointAct
+    global topSearch
+    if inp is not None:
+        (inputFile, procFile, outputFile) = (inp, proc, out)
     roundCount = 0
-    delProcessing()
-    taskAct = ''
-    for file in glob.glob('*.zip'):
-        if os.path.splitext(file)[0] not in dirs:
-            ct.unzipFiles(file)
-            dirs.append(os.path.splitext(file)[0])
-        if '_Task_Report_' in file:
-            taskAct = file.split('_Task_Report_')[0]
-    for aDir in dirs:
-        if 'National Accounts_Config_Report' in aDir: continue
-        if '_Config_Report_' in aDir and taskAct not in aDir:
-            os.chdir(aDir)
-            unpackClassifications()
-            unpackClassGroups()
-            unpackPCLinks()
-            try:
-                addNatAccs()
-            except:
-                ct.error('National Accounts Level config not found')
-            os.chdir(inputFile)
-        if taskAct+'_Task_Report_' in aDir:
-            os.chdir(aDir)
-            unpackTasks()
-            os.chdir(inputFile)
-        if taskAct+'_Config_Report_' in aDir:
-            os.chdir(aDir)
-            unpackClassMaps()
-            fillDependancies()
-            datasetCriteria()
-            os.chdir(inputFile)
-    fillSelCritDfs()
-    checkChanges()
+    state = None
+    if queryFile is None:
+        state = resumeCheckpoint()
+    if state is None:
+        delProcessing()
+        clearCheckpoint()
+    else:
+        taskAct = state['Stat Act']
+    zips = inputZips()
+    acts = taskActs(zips)
+    if taskAct is None:
+        if len(acts) > 1 and queryFile is None:
+            taskAct = chooseStatAct(acts)
+        else:
+            taskAct = acts[-1] if acts != [] else ''
+    statActModels = {}
+    stepStats = []
+    loadStatAct(zips, taskAct)
     
-    os.chdir(outputFile)
-    modeInt = mode()
+    if queryFile is not None:
+        runQueries(queryFile)
+        return
+    #Only the top level interactive search in the starting stat act is
+    #checkpointed
+    checkpointAct = taskAct
+    topSearch = True
+    if state is not None:
+        restoreCheckpoint(state)
+        searchLoop()
+        modeInt = 0
+    else:
+        modeInt = mode()
+    if modeInt in {3, 4}:
+        checkpointAct = ''
+        topSearch = False
+    if modeInt == 3:
+        runQueries(input('Enter the filepath of the batch query csv: ')\
+                   .strip().strip('"'))
+        return
+    if modeInt == 4:
+        searchByFeeds()
+        cacheStats()
+        return
     if modeInt == 1:
         searchBySelCrit()
     if modeInt == 2:
@@ -946,23 +2058,73 @@ def runTask():
     effectedDf.drop('Order', axis=1, inplace=True)
     print(effectedDf)
     try:
-        effectedDf.to_excel('Effected Calcs.xlsx', index=False,
-                        sheet_name='Effected Calcs')
+        effectedDf.to_excel(os.path.join(outputFile, 'Effected Calcs.xlsx'),
+                            index=False, sheet_name='Effected Calcs')
     except:
         ct.error('Failed to save Effected Calcs!')
-    fillImpactedDfs()
+    impactDf = fillImpactedDfs()
     createGraph(effectedDf)
-    checkDependencies()
+    checkDependencies(impactDf)
+    cacheStats()
+    searchProfile()
+    saveMatchCache()
+    clearCheckpoint()
             
+#Map of ingestion job kinds to the functions that read them
+INGESTERS = {'Itms': readClassification,
+             'Grp': readClassGroup,
+             'PCLnk': ch.loadPCLinks,
+             'MpItm': cm.readMapping,
+             'Task': readTaskReport,
+             'ExtDatasets': readExtDatasets,
+             'DatasetDefs': readDatasetDefs}
+#Number of processes used to read reports, None uses every available core
+INGEST_WORKERS = None
+#Formats the impact graph is saved in, any of 'graphml', 'dot' and 'json'
+GRAPH_FORMATS = ['graphml', 'dot', 'json']
+#Set GRAPH_IMAGE to False to skip rendering the impact graph to a png
+GRAPH_IMAGE = True
+#Parts of each propagation step that are timed separately, anything else is
+#counted as bookkeeping
+STEP_PARTS = ['Expansion', 'Matching', 'IO']
+#Seconds between search checkpoints, None turns checkpointing off. Bump
+#CHECKPOINT_VERSION whenever the checkpointed state changes
+CHECKPOINT_EVERY = 60
+CHECKPOINT_VERSION = 1
+#Bump INDEX_VERSION whenever the structures in MODEL_KEYS change so that old
+#impact indexes are rebuilt rather than loaded
+INDEX_VERSION = 6
+MODEL_KEYS = ['classifications', 'classGrps', 'classMaps', 'hierarchies',
+              'taskGrps', 'inCrit', 'outCrit', 'undroppable', 'datasetCritDf',
+              'dependanciesDf', 'calcPrints']
 classifications = pd.DataFrame()
 classGrps = pd.DataFrame()
-classMaps = pd.DataFrame()
+classMaps = {}
 taskGrps = pd.DataFrame()
-pcDf = pd.DataFrame()
+hierarchies = {}
+datasetCritDf = pd.DataFrame()
 datasetImpactDf = pd.DataFrame()
-dependanciesDf = pd.DataFrame(columns=['Stat Act', 'Mode', 'Task Name',
-                                       'Effected Dataset', 'Source Dataset',
-                                       'Selection Criteria'])
+DEPENDANCY_COLS = ['Stat Act', 'Mode', 'Task Name', 'Effected Dataset',
+                   'Source Dataset', 'Selection Criteria',
+                   'Dimension Mappings']
+dependanciesDf = pd.DataFrame(columns=DEPENDANCY_COLS)
 effectedDf = pd.DataFrame(columns=['Effected Calc', 'Effected By', 'Searched'])
-(inputFile, procFile, outputFile) = ct.setupFilepaths(proc=True)
-runTask()
\ No newline at end of file
+calcPrints = {}
+matchCache = {}
+curIndex = None
+savedCacheSize = 0
+stepTimes = dict.fromkeys(STEP_PARTS, 0.0)
+stepTimes['Matched'] = 0
+stepStats = []
+lastState = None
+lastSave = 0
+topSearch = False
+checkpointSearch = False
+procSnapshots = {}
+zipHashes = {}
+statActModels = {}
+curStatAct = ''
+checkpointAct = ''
+if __name__ == '__main__':
+    (inputFile, procFile, outputFile) = ct.setupFilepaths(proc=True)
+    runTask()
\ No newline at end of file
@@ -25,9 +25,8 @@ The Difference dataset is the Post dataset - the Pre dataset.
 Author: Ross Gregory-Davies : gregor1
 """
 import pandas as pd
-import os, sys, glob, datetime, warnings, time
+import os, sys, warnings, time
 import numpy as np
-import matplotlib.pyplot as plt
 import CORDtools as ct
 
 def prelimReadCsv(file):
@@ -43,7 +42,7 @@ def prelimReadCsv(file):
     perDf = df[df[0].str.contains(', Periodicity:')].copy()
     if dimDf.empty:
         ct.error('File: "'+ file +'" is not in the correct CORD csv format.')
-        sys.exit()
+        sys.exit(1)
     blanksDf = df[df[0]==''].copy()
     badFile = False
     if blanksDf.empty:
@@ -69,7 +68,7 @@ def prelimReadCsv(file):
                 .values[0][0].split(',')[1].strip().strip('"')
             except:
                 ct.error('File format error regarding periodicity.')
-                sys.exit()
+                sys.exit(1)
         else:
             dimDf.loc[r, 2] = perDf.iloc[c, 0].split(', Periodicity:')[1]\
                             .split(',')[0].strip()
@@ -120,7 +119,7 @@ def readCORDcsv(file, leadingZeros=True):
         #Rename the dimension columns to their proper titles
         for d in range(noOfDims):
             #Forward fill the index columns ready for multiindexing
-            df[dims[d]].fillna(method='ffill', inplace=True)
+            df[dims[d]] = df[dims[d]].ffill()
         #Drop any leftover unnamed columns
         df.drop(df.columns[df.columns.str.contains('Unnamed: ')].tolist(),
                            axis=1, inplace=True)
@@ -149,11 +148,10 @@ def readPreChange(lZeros):
     (returned by readCORDcsv) to the filesDf Dataframe.
     """
     global filesDf
-    os.chdir(inpFol)
     for i, file in enumerate(preFiles):
         print('Reading Pre-Change file for', file[:-18]+'...')
         r = filesDf['Pre File Name'].count()
-        dfs = readCORDcsv(file, lZeros)
+        dfs = readCORDcsv(os.path.join(inpFol, file), lZeros)
         filesDf.loc[r, 'Pre File Name'] = file
         filesDf.loc[r, 'Post File Name'] = postFiles[i]
         pers = []
@@ -170,10 +168,9 @@ def readPostChange(lZeros):
     already been read.
     """
     global filesDf
-    os.chdir(inpFol)
     for idx, file in enumerate(filesDf['Post File Name'].tolist()):
         print('Reading Post-Change file for', file[:-18]+'...')
-        dfs = readCORDcsv(file, lZeros)
+        dfs = readCORDcsv(os.path.join(inpFol, file), lZeros)
         pers = []
         for i, (df, p) in enumerate(dfs):
             if df.index.names != filesDf.loc[idx, 'Pre'][0][0].index.names:
@@ -186,7 +183,7 @@ def readPostChange(lZeros):
                     ct.error('Unable to reorder Post Index to match Pre, likely'
                           ' because the dimensions are different. Please fix'
                           ' this file before continuing!...')
-                    sys.exit()
+                    sys.exit(1)
             pers.append(p)
         prePers = filesDf.loc[idx, 'Periodicities'].split(',')
         if len(pers) != len(prePers):
@@ -221,7 +218,7 @@ def configureNans(preDf,postDf,compDf,method='optimal'):
     """
     if method not in {'optimal','fast','lowmem', 'none'}:
         ct.error('Unknown NaN configuration method.')
-        sys.exit()
+        sys.exit(1)
     colsNotInPre = list(set(compDf.columns.values).symmetric_difference(\
                          preDf.columns.values))
     colsNotInPost = list(set(compDf.columns.values).symmetric_difference(\
@@ -230,6 +227,8 @@ def configureNans(preDf,postDf,compDf,method='optimal'):
                          .index.values))
     rowsNotInPost = list(set(compDf.index.values).symmetric_difference(postDf\
                          .index.values))
+    #The differences are marked with strings alongside the numbers
+    compDf = compDf.astype(object)
     compDf.loc[:, colsNotInPre] = 'Col Not In Pre'
     compDf.loc[:, colsNotInPost] = 'Col Not In Post'
     compDf.loc[rowsNotInPre, :] = 'Row Not In Pre'
@@ -364,7 +363,9 @@ def compare():
                                        index=compDf.index,
                                        columns=compDf.columns))
                     maxABSdiff = compDf.abs().max(axis=1)
-                    maxDate = compDf.abs().idxmax(axis=1)
+                    #Rows with no differences at all have no max date
+                    maxDate = compDf.abs().dropna(how='all')\
+                              .idxmax(axis=1).reindex(compDf.index)
                     maxAsPerc = percDf.abs().max(axis=1).round(1)
                     overallABSdiff = compDf.abs().sum(axis=1)
                     #overallDiff = compDf.sum(axis=1)
@@ -393,7 +394,7 @@ def compare():
                     except Exception as ex:
                         ct.error('Failed to configure NaNs.\nError Message: '+
                               str(ex))
-                        sys.exit()
+                        sys.exit(1)
                     compDf['Max ABS Diff (%)'] = maxAsPerc
                     compDf['Max ABS Diff'] = maxABSdiff
                     compDf['Max Diff Date'] = maxDate
@@ -419,7 +420,7 @@ def seriesCol(df, prePost):
     """
     if prePost not in {'BEFORE','AFTER'}:
         ct.error("seriesCol must be handed the string 'BEFORE' or 'AFTER'.")
-        sys.exit()
+        sys.exit(1)
     origIndex = df.index.names
     df['Before After'] = [prePost]*len(df.index.tolist())
     df.reset_index(inplace=True)
@@ -504,67 +505,67 @@ def formatSheet(df, sheet, style, comparison=False):
         ws.set_column(i, i, width)
 
 def outFolder():
-    """Changes directories to the output folder setting one up if it doesn't 
-    already exist.
+    """Returns the path of this run's folder in the output folder, setting one
+    up if it doesn't already exist.
     """
-    os.chdir(outFol)
-    fol = datetime.datetime.now().strftime("%d-%m-%Y (%H;%M;%S)")
-    try:
-        os.chdir(fol)
-    except:
-        os.mkdir(fol)
-        os.chdir(fol)
+    return ct.createOutFolder(outFol)
 
 def write(fileType='xlsx'):
     """Writes all outputs for files in filesDf.
     """
     global writer
-    outFolder()
+    outPath = outFolder()
     if fileType not in {'csv', 'xlsx'}:
         ct.error('Unrecognised filetype chosen. Defaulting to xlsx.',
               warning=True)
         fileType = 'xlsx'
     if fileType == 'xlsx':
         for idx, file in enumerate(filesDf['Pre File Name']):
-            filename = file[:-18]
+            filename = os.path.join(outPath, file[:-18])
             print('Creating comparison spreadsheet for', file[:-18]+'...')
-            writer = pd.ExcelWriter(filename + ' Comparison.xlsx',
-                                    engine='xlsxwriter')
-            for per in filesDf.loc[idx, 'Periodicities'].split(','):
-                if preSheet:
-                    for df, p in filesDf.loc[idx, 'Pre']:
-                        if p == per:
-                            preDf = seriesCol(df.replace(np.nan, '.'),'BEFORE')
-                if postSheet:
-                    for df, p in filesDf.loc[idx, 'Post']:
+            with pd.ExcelWriter(filename + ' Comparison.xlsx',
+                                engine='xlsxwriter') as writer:
+                for per in filesDf.loc[idx, 'Periodicities'].split(','):
+                    if preSheet:
+                        for df, p in filesDf.loc[idx, 'Pre']:
+                            if p == per:
+                                preDf = seriesCol(df.replace(np.nan, '.'),
+                                                  'BEFORE')
+                    if postSheet:
+                        for df, p in filesDf.loc[idx, 'Post']:
+                            if p == per:
+                                postDf = seriesCol(df.replace(np.nan, '.'),
+                                                   'AFTER')
+                    for df, p in filesDf.loc[idx, 'Comp']:
                         if p == per:
-                            postDf = seriesCol(df.replace(np.nan, '.'),'AFTER')
-                for df, p in filesDf.loc[idx, 'Comp']:
-                    if p == per:
-                        compDf = df
-                if preSheet:
-                    preDf.to_excel(writer, sheet_name='Pre-Change ('+per+')',
-                                   merge_cells=False,
-                                   freeze_panes=(1,len(preDf.index.names)))
-                    style = 'Table Style Medium 4'
-                    formatSheet(preDf, 'Pre-Change ('+per+')', style)
-                if postSheet:
-                    postDf.to_excel(writer, sheet_name='Post-Change ('+per+')',
-                                   merge_cells=False,
-                                   freeze_panes=(1,len(postDf.index.names)))
-                    style = 'Table Style Medium 7'
-                    formatSheet(postDf, 'Post-Change ('+per+')', style)
-                compDf.to_excel(writer, sheet_name='Difference ('+per+')',
-                               merge_cells=False,
-                               freeze_panes=(1,len(compDf.index.names)))
-                style = 'Table Style Medium 1'
-                formatSheet(compDf, 'Difference ('+per+')', style,
-                            comparison=True)
-            print('Saving...')
-            writer.save()
+                            compDf = df
+                    if preSheet:
+                        preDf.to_excel(writer,
+                                       sheet_name='Pre-Change ('+per+')',
+                                       merge_cells=False,
+                                       freeze_panes=(1,
+                                                     len(preDf.index.names)))
+                        style = 'Table Style Medium 4'
+                        formatSheet(preDf, 'Pre-Change ('+per+')', style)
+                    if postSheet:
+                        postDf.to_excel(writer,
+                                        sheet_name='Post-Change ('+per+')',
+                                        merge_cells=False,
+                                        freeze_panes=(1,
+                                                      len(postDf.index.names)))
+                        style = 'Table Style Medium 7'
+                        formatSheet(postDf, 'Post-Change ('+per+')', style)
+                    compDf.to_excel(writer,
+                                    sheet_name='Difference ('+per+')',
+                                    merge_cells=False,
+                                    freeze_panes=(1,len(compDf.index.names)))
+                    style = 'Table Style Medium 1'
+                    formatSheet(compDf, 'Difference ('+per+')', style,
+                                comparison=True)
+                print('Saving...')
     if fileType == 'csv':
         for idx, file in enumerate(filesDf['Pre File Name']):
-            filename = file[:-18]
+            filename = os.path.join(outPath, file[:-18])
             print("Saving csv's for", file[:-18]+'...')
             for per in filesDf.loc[idx, 'Periodicities'].split(','):
                 for df, p in filesDf.loc[idx, 'Comp']:
@@ -591,7 +592,8 @@ def configureFiles():
     postFiles = []
     inputFiles = pd.DataFrame(columns=['File','Name','Year','Month','Day',
                                        'Time'])
-    for file in glob.glob('*.csv'):
+    for file in ct.folderFiles(inpFol, '*.csv'):
+        file = os.path.basename(file)
         r = len(inputFiles.index.tolist())
         try:
             inputFiles.loc[r,'File'] = file
@@ -634,11 +636,12 @@ def configureFiles():
             inputFiles.drop(idxs, inplace=True)
             continue
         ct.error('Something went wrong in configureFiles.')
-        sys.exit()
+        sys.exit(1)
     
 def writeGraphs():
     """Experimental feature, not currently working.
     """
+    import matplotlib.pyplot as plt
     for idx, file in enumerate(filesDf['Pre File Name']):
         filename = file[:-18]
         print('Graphing results for', filename+'...')
@@ -656,8 +659,9 @@ def writeGraphs():
                     plt.show()
         print('Saving...')
 
-def runTask(lZeros=True, createGraphs=False):
-    """Main task for running the script.
+def runTask(lZeros=True, createGraphs=False, inp=None, out=None):
+    """Main task for running the script. The INPUT and OUTPUT folders are
+    asked for unless given as inp and out.
     """
     global filesDf, inpFol, outFol
     if trackTime: start = time.time()
@@ -667,8 +671,9 @@ def runTask(lZeros=True, createGraphs=False):
                           category=pd.errors.PerformanceWarning)
     filesDf = pd.DataFrame(columns=['Pre File Name', 'Post File Name',
                                     'Periodicities', 'Pre', 'Post', 'Comp'])
-    (inpFol, outFol) = ct.setupFilepaths()
-    os.chdir(inpFol)
+    if inp is None or out is None:
+        (inp, out) = ct.setupFilepaths()
+    (inpFol, outFol) = (inp, out)
     configureFiles()
     readPreChange(lZeros)
     readPostChange(lZeros)
@@ -696,6 +701,6 @@ trackTime = True
 #=============================================================================
 
 createGraphs = False
-runTask(leadingZeros, createGraphs)
-os.chdir(inpFol)
-ct.done()
\ No newline at end of file
+if __name__ == '__main__':
+    runTask(leadingZeros, createGraphs)
+    ct.done()
\ No newline at end of file
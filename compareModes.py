@@ -14,7 +14,7 @@ Bluebook), the file will be skipped.
 Author: Ross Gregory-Davies : gregor1
 """
 
-import os, sys, glob
+import os, sys, io
 import numpy as np
 import pandas as pd
 from datetime import datetime
@@ -39,18 +39,19 @@ def readSummmary(dirname):
     checks.
     """
     global inpFol
-    os.chdir(dirname)
     files = []
-    for (dirpath, dirnames, filenames) in os.walk(os.getcwd()):
+    for (dirpath, dirnames, filenames) in os.walk(os.path.join(inpFol,
+                                                               dirname)):
         files.extend(filenames)
         break
     for file in files:
+        path = os.path.join(dirpath, file)
         if '_Comparison_Report_Summary_' in file:
             splitDir = dirname.split('_Stat_Act_Comparision_Report_')
-            summaryDf = pd.read_csv(file, skiprows=5, header=None,
-                                       encoding='unicode_escape')
-            headerDf = pd.read_csv(file, header=None, sep='|',
-                                       encoding='unicode_escape')
+            text = ct.readReportText(path)
+            summaryDf = pd.read_csv(io.StringIO(text), skiprows=5,
+                                    header=None)
+            headerDf = pd.read_csv(io.StringIO(text), header=None, sep='|')
             infoLine = headerDf.loc[2, 0]
             splitInfo = infoLine.split('/')
             src = splitInfo[1].split(' ')[0]
@@ -63,7 +64,6 @@ def readSummmary(dirname):
             src = 'invalid'
             trg = 'invalid'
             splitDir = ['invalid']
-    os.chdir(inpFol)
     return summaryDf, splitDir[0], src, trg
     
 def formatComparison(writer):
@@ -112,8 +112,6 @@ def adjustCO(sys, field):
     """
     global writer
     global coDf
-    returnPath = os.getcwd()
-    os.chdir(outFol)
     wb = writer.book
     ws = writer.sheets['Comparison Overview']
     col = None
@@ -135,7 +133,6 @@ def adjustCO(sys, field):
                                                   'valign': 'vcenter',
                                                   'bold': True,
                                                   'font_color': 'white'}))
-    os.chdir(returnPath)
 
 def createSheetDf(sheet):
     """Returns the dataframe holding the comparison field data for all systems
@@ -153,27 +150,26 @@ def createSheetDf(sheet):
         ct.error('Unrecognised sheet, skipping...')
         return
     #Create a list containing all files
-    for (dirpath, dirnames, filenames) in os.walk(os.getcwd()):
+    for (dirpath, dirnames, filenames) in os.walk(os.path.join(inpFol,
+                                                               curDir)):
         files.extend(filenames)
         break
     #loop through files until we find the one we're looking for
     for file in files:
-        if sheetFileName in file:
+        file = os.path.join(dirpath, file)
+        if sheetFileName in os.path.basename(file):
             dataStart = None
             basAtr = None
             #Try to read the csv, if the encoding is unrecognised the send
             #it to adjustCO to show it's been skipped on output sheet.
             try:
-                prelimDf = pd.read_csv(file, header=None, sep='\n',
-                               encoding = 'unicode_escape')
-                #prelimDf = pd.read_csv(file, header=None, sep='\n', 
-                 #                      ct.error_bad_lines=False)
+                text = ct.readReportText(file)
             except:
                 ct.error('BAD ENCODING IN '+curDir+' \nSKIPPING DATA,'+
                       'THIS WILL NEED TO BE REVIEWED MANUALLY...\033[93m')
                 adjustCO(curDir.split('_')[0], sheet)
                 continue
-            for i, line in enumerate(prelimDf.iloc[:,0]):
+            for i, line in enumerate(text.splitlines()):
                 #Find where the data starts
                 if 'Name,Match' in line:
                     dataStart = i+2
@@ -184,8 +180,8 @@ def createSheetDf(sheet):
                     basAtr = line.split('Basic Attributes: ')[-1]
                     basAtr = basAtr[:-2]
             #Get the sheet dataframe containing it's predefined columns
-            sheetDf = pd.read_csv(file, skiprows=dataStart, quotechar='"',
-                               names=headerNames, encoding = 'unicode_escape')
+            sheetDf = pd.read_csv(io.StringIO(text), skiprows=dataStart,
+                                  quotechar='"', names=headerNames)
             sheetDf.drop('Placeholder', inplace=True, axis=1)
             #Create a dataframe to hold data from all files
             finalDf = pd.DataFrame(columns=['System',
@@ -228,7 +224,7 @@ def createSheetDf(sheet):
                     if rowDf.loc[0, 'Name'] == 'Name' and \
                     rowDf.loc[0, 'Location'] == 'Match':
                         continue
-                    finalDf = finalDf.append(rowDf, ignore_index=True)
+                    finalDf = pd.concat([finalDf, rowDf], ignore_index=True)
                     
             return finalDf
 
@@ -242,7 +238,6 @@ def createSheet(sheet):
     global coDf
     global sheetDict
     global curDir
-    os.chdir(inpFol)
     changed = []
     dfList = []
     print('Creating sheet for ' + sheet + '...')
@@ -257,10 +252,11 @@ def createSheet(sheet):
     for changedSys in changed:
         for aDir in dirs:
             if changedSys in aDir:
-                os.chdir(inpFol)
-                os.chdir(aDir)
                 curDir = aDir
-                dfList.append(createSheetDf(sheet))
+                sheetDf = createSheetDf(sheet)
+                #Skipped files have already been marked for review
+                if sheetDf is not None:
+                    dfList.append(sheetDf)
     bigDf = pd.DataFrame()
     #Compile the list of dataframes into one big dataframe
     for df in dfList:
@@ -268,7 +264,7 @@ def createSheet(sheet):
         df.dropna(how='all', subset=['Name','Location','Differences'],
                   inplace=True)
         df = df.replace(np.nan, '')
-        bigDf = bigDf.append(df)
+        bigDf = pd.concat([bigDf, df])
     #Create a worksheet using xlsxwriter
     wb = writer.book
     ws = wb.add_worksheet(sheet)
@@ -346,9 +342,10 @@ def createSheet(sheet):
     ws.set_column(2, 2, 11)
     ws.set_column(3, 3, 126)
         
-def runTask():
+def runTask(inp=None, out=None):
     """Runs the overall task, converting zip files in the INPUT folder into
-    an xlsx sheet in the OUTPUT folder.
+    an xlsx sheet in the OUTPUT folder. The folders are asked for unless
+    given as inp and out.
     """
     global inpFol
     global outFol
@@ -357,15 +354,18 @@ def runTask():
     global dirs
     origSrc = None
     origTrg = None
-    (inpFol, outFol) = ct.setupFilepaths()
-    os.chdir(inpFol)
+    if inp is None or out is None:
+        (inp, out) = ct.setupFilepaths()
+    (inpFol, outFol) = (inp, out)
     dirs = []
+    zips = [os.path.basename(path) for path in
+            ct.folderFiles(inpFol, '*.zip')]
     #Unzip all zip files
-    if list(glob.glob('*.zip')) == []:
+    if zips == []:
         ct.error('NO INPUT FILES FOUND. Place CORD Stat Act Comparison zip '+
               'files in the INPUT file and re-run.')
-        sys.exit()
-    for file in glob.glob('*.zip'):
+        sys.exit(1)
+    for file in zips:
         if 'Stat_Act_Comparision_Report' not in file:
             ct.error(file + ' is not a Comparison Report, this file will be '+
                   'skipped.', warning=True)
@@ -379,7 +379,7 @@ def runTask():
                       warning=True)
                 skip=True
         if skip: continue
-        ct.unzipFiles(file)
+        ct.unzipFiles(os.path.join(inpFol, file))
         dirs.append(os.path.splitext(file)[0])
     #Read all directories to create the comparison dataset
     for aDir in dirs:
@@ -405,12 +405,11 @@ def runTask():
     compTitle = 'Comparison Overview (' + src + '-' + trg + ') ' + date +\
     '.xlsx'
     sameFiles = []
-    for file in glob.glob('*.xlsx'):
+    for file in ct.folderFiles(outFol, '*.xlsx'):
         if compTitle[:-5] in file:
             sameFiles.append(file)
-    if os.path.exists(compTitle):
+    if os.path.exists(os.path.join(outFol, compTitle)):
         compTitle = compTitle[:-5] + '(' + str(len(sameFiles)) + ').xlsx'
-    writer = pd.ExcelWriter(compTitle, engine='xlsxwriter')
     coDf.columns = ['CLASSIFICATION',
                     'TASK',
                     'MAPPINGS',
@@ -422,19 +421,18 @@ def runTask():
                     'SEAS EXPORT DEFS',
                     'VISUALISATIONS',
                     'EXPORT DEFS']
-    coDf.to_excel(writer, sheet_name='Comparison Overview')
-    print('Applying formatting to Comparison Overview...')
-    formatComparison(writer)
-    
-    #Create a comparison sheet for every comparison field that has a changed
-    #system
-    coDfAdj = coDf.dropna(how='all', axis=1)
-    for col in coDfAdj.columns:
-        createSheet(col)
-            
-    #Save the file
-    os.chdir(outFol)
-    writer.save()
+    #The file is saved when the with block closes the writer
+    with pd.ExcelWriter(os.path.join(outFol, compTitle),
+                        engine='xlsxwriter') as writer:
+        coDf.to_excel(writer, sheet_name='Comparison Overview')
+        print('Applying formatting to Comparison Overview...')
+        formatComparison(writer)
+
+        #Create a comparison sheet for every comparison field that has a
+        #changed system
+        coDfAdj = coDf.dropna(how='all', axis=1)
+        for col in coDfAdj.columns:
+            createSheet(col)
 #Predefine the comparison overview dataframe to be accessible to all functions
 coDf = pd.DataFrame(columns = ['CLASSIFICATION',
                                'TASK',
@@ -461,5 +459,6 @@ sheetDict = [['CLASSIFICATION', 'Classifications'],
              ['EXPORT DEFS', 'Export_Definitions']]
              
 #Run the script
-runTask()
-ct.done()
\ No newline at end of file
+if __name__ == '__main__':
+    runTask()
+    ct.done()
\ No newline at end of file
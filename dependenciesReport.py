@@ -6,7 +6,7 @@ Created on Fri Jan 24 15:29:04 2020
 """
 
 import pandas as pd
-import glob, os, datetime
+import os, datetime
 import CORDtools as ct
 
 def updateMasters():
@@ -19,28 +19,24 @@ def updateMasters():
             outMasterDf.loc[topLine, 'Target'] = extDataOutDf.loc[r,
                                                             'Stat Activity']
             outMasterDf.loc[topLine, 'Copy Calc'] = extDataOutDf.loc[r, 'Name']
-            selCritList = ct.splitCordString(extDataOutDf.loc[r,
+            selCritList = ct.parseCordString(extDataOutDf.loc[r,
                                                          'Selection Criteria'])
-            dimMapList = ct.splitCordString(extDataOutDf.loc[r,
+            dimMapList = ct.parseCordString(extDataOutDf.loc[r,
                                                          'Dimension Mappings'])
-            selCritDf = pd.DataFrame()
+            selCrits = {}
             for c1, selCrit in enumerate(selCritList):
-                outMasterDf.loc[topLine+c1, 'Data Sent'] = selCrit
-                splitSelCrit = selCrit.split(' = ')
-                selCritDf.loc[splitSelCrit[0], 'Value'] = splitSelCrit[1]
+                outMasterDf.loc[topLine+c1, 'Data Sent'] = selCrit.key+' = '\
+                                                   +selCrit.value
+                selCrits[selCrit.key] = selCrit.value
             for c2, dimMap in enumerate(dimMapList):
-                dimType = dimMap.split('-> ')[1].split('(')[1].split(')')[0]
-                splitDim = dimMap.split('->')
-                left = splitDim[1].split(') ')[1].strip()
-                if dimType == 'Direct':
-                    right = selCritDf.loc[splitDim[0].strip(), 'Value']
-                if dimType == 'Unmapped':
-                    right = dimMap.split('-> ')[0]
-                if dimType == 'Indirect':
-                    splitLeft = left.split(' classification mapping = ')
-                    left = splitLeft[0]
-                    right = selCritDf.loc[splitDim[0].strip(), 'Value']
-                    right += ' (Mapped using ' + splitLeft[1] + ')'
+                left = dimMap.value
+                if dimMap.mapType == 'Direct':
+                    right = selCrits[dimMap.key]
+                if dimMap.mapType == 'Unmapped':
+                    right = dimMap.key
+                if dimMap.mapType == 'Indirect':
+                    right = selCrits[dimMap.key]
+                    right += ' (Mapped using ' + dimMap.mapping + ')'
                 outMasterDf.loc[topLine+c2, 'Data Recieved'] = left+' = '+right
     if not extDataInDf.empty:
         for r in extDataInDf.index.tolist():
@@ -50,42 +46,31 @@ def updateMasters():
                                                 .split(')')[0]
             inMasterDf.loc[topLine, 'Target'] = curStatAct
             inMasterDf.loc[topLine, 'Copy Calc'] = extDataInDf.loc[r, 'Name']
-            selCritList = ct.splitCordString(extDataInDf.loc[r,
+            selCritList = ct.parseCordString(extDataInDf.loc[r,
                                                          'Selection Criteria'])
-            dimMapList = ct.splitCordString(extDataInDf.loc[r,
+            dimMapList = ct.parseCordString(extDataInDf.loc[r,
                                                          'Dimension Mappings'])
-            selCritDf = pd.DataFrame()
+            selCrits = {}
             for c1, selCrit in enumerate(selCritList):
-                inMasterDf.loc[topLine+c1, 'Data Sent'] = selCrit
-                splitSelCrit = selCrit.split(' = ')
-                selCritDf.loc[splitSelCrit[0], 'Value'] = splitSelCrit[1]
+                inMasterDf.loc[topLine+c1, 'Data Sent'] = selCrit.key+' = '\
+                                                   +selCrit.value
+                selCrits[selCrit.key] = selCrit.value
             for c2, dimMap in enumerate(dimMapList):
-                dimType = dimMap.split('-> ')[1].split('(')[1].split(')')[0]
-                splitDim = dimMap.split('->')
-                left = splitDim[1].split(') ')[1].strip()
-                if dimType == 'Direct':
-                    right = selCritDf.loc[splitDim[0].strip(), 'Value']
-                if dimType == 'Unmapped':
-                    right = dimMap.split('-> ')[0]
-                if dimType == 'Indirect':
-                    splitLeft = left.split(' classification mapping = ')
-                    left = splitLeft[0]
-                    right = selCritDf.loc[splitDim[0].strip(), 'Value']
-                    right += ' (Mapped using ' + splitLeft[1] + ')'
+                left = dimMap.value
+                if dimMap.mapType == 'Direct':
+                    right = selCrits[dimMap.key]
+                if dimMap.mapType == 'Unmapped':
+                    right = dimMap.key
+                if dimMap.mapType == 'Indirect':
+                    right = selCrits[dimMap.key]
+                    right += ' (Mapped using ' + dimMap.mapping + ')'
                 inMasterDf.loc[topLine+c2, 'Data Recieved'] = left+' = '+right
 
 def readExtDatasets():
     global extDataOutDf
     global extDataInDf
-    extDataOutDf = pd.DataFrame()
-    extDataInDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'External_Datasets_Out_rpt_' in file:
-            extDataOutDf = pd.read_csv(file, skiprows=3,
-                                       encoding='unicode_escape')
-        if 'External_Datasets_In_rpt_' in file:
-            extDataInDf = pd.read_csv(file, skiprows=3,
-                                      encoding='unicode_escape')
+    extDataOutDf = report.extDatasetsOut
+    extDataInDf = report.extDatasetsIn
 
 def formatSheet(sheet, df):
     wb = writer.book
@@ -117,45 +102,50 @@ def formatSheet(sheet, df):
 
 def write():
     global writer
-    os.chdir(outFol)
     timeStr = datetime.datetime.now().strftime("%d-%m-%Y (%H;%M;%S)")
-    writer = pd.ExcelWriter('Dependencies Report '+timeStr+'.xlsx',
-                            engine='xlsxwriter')
-    outMasterDf.to_excel(writer, sheet_name='External Dependencies',
-                         index=False)
-    inMasterDf.to_excel(writer, sheet_name='Internal Dependencies',
-                         index=False)
-    formatSheet('External Dependencies', outMasterDf)
-    formatSheet('Internal Dependencies', inMasterDf)
-    writer.save()
+    with pd.ExcelWriter(os.path.join(outFol, 'Dependencies Report '+
+                                     timeStr+'.xlsx'),
+                        engine='xlsxwriter') as writer:
+        outMasterDf.to_excel(writer, sheet_name='External Dependencies',
+                             index=False)
+        inMasterDf.to_excel(writer, sheet_name='Internal Dependencies',
+                             index=False)
+        formatSheet('External Dependencies', outMasterDf)
+        formatSheet('Internal Dependencies', inMasterDf)
 
-def runTask():
+def runTask(inp=None, out=None):
+    """Writes the dependencies report of the Config Reports in the INPUT
+    folder inp to the OUTPUT folder out, asking for the folders if not given.
+    """
     global outMasterDf
     global inMasterDf
     global configReports
     global curStatAct
     global inpFol, outFol
+    global report
     outMasterDf = pd.DataFrame(columns=['Source','Target', 'Data Sent', 
                                      'Data Recieved', 'Copy Calc'])
     inMasterDf = pd.DataFrame(columns=['Source','Target', 'Data Sent', 
                                      'Data Recieved', 'Copy Calc'])
-    (inpFol, outFol) = ct.setupFilepaths()
+    if inp is None or out is None:
+        (inp, out) = ct.setupFilepaths()
+    (inpFol, outFol) = (inp, out)
     configReports = ct.unzipConfigReports(inpFol)
+    reports = ct.loadConfigReports([os.path.join(inpFol, rpt) for rpt in
+                                    configReports['Config Report']],
+                                   ('extDatasetsOut', 'extDatasetsIn'))
     for i, configRpt in enumerate(configReports['Config Report']):
         curStatAct = configReports.loc[i, 'Statistical Activity']
-        os.chdir(inpFol)
-        os.chdir(configRpt)
+        report = reports[i]
         print('Reading external dependencies for ' + curStatAct + '...')
         readExtDatasets()
         updateMasters()
-    outMasterDf['Source'].fillna(method='ffill', inplace=True)
-    outMasterDf['Target'].fillna(method='ffill', inplace=True)
-    outMasterDf['Copy Calc'].fillna(method='ffill', inplace=True)
-    inMasterDf['Source'].fillna(method='ffill', inplace=True)
-    inMasterDf['Target'].fillna(method='ffill', inplace=True)
-    inMasterDf['Copy Calc'].fillna(method='ffill', inplace=True)
+    for col in ['Source', 'Target', 'Copy Calc']:
+        outMasterDf[col] = outMasterDf[col].ffill()
+        inMasterDf[col] = inMasterDf[col].ffill()
+    ct.closeArchives()
     write()
-    
-runTask()
-os.chdir(inpFol)
-ct.done()
\ No newline at end of file
+
+if __name__ == '__main__':
+    runTask()
+    ct.done()
\ No newline at end of file
@@ -30,20 +30,26 @@ The script currently checks for the following:
 Author: Ross Gregory-Davies : gregor1
 """
 import pandas as pd
-import glob, os, datetime
+import os, datetime
 import CORDtools as ct
 
+def readDates(dates):
+    """Returns a series of CORD date strings as datetimes.
+    """
+    return pd.to_datetime(dates, format='%d/%m/%Y %H:%M:%S')
+
+def writeDates(dates):
+    """Returns a series of datetimes as CORD date strings.
+    """
+    return dates.dt.strftime('%d/%m/%Y %H:%M:%S')
+
 def readTasks():
     global tasksDf
-    tasksDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'Tasks_rpt_' in file:
-            tasksDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-            for r, usedDate in enumerate(tasksDf['Date Last Used']):
-                tasksDf.loc[r, 'Date Last Used'] = datetime.datetime.strptime(\
-                           tasksDf.loc[r,'Date Last Used'],'%d/%m/%Y %H:%M:%S')
-            tasksDf.drop('Is Parallel', axis=1, inplace=True)
-            tasksDf = tasksDf.set_index('Name')
+    tasksDf = report.tasks
+    if not tasksDf.empty:
+        tasksDf['Date Last Used'] = readDates(tasksDf['Date Last Used'])
+        tasksDf.drop('Is Parallel', axis=1, inplace=True)
+        tasksDf = tasksDf.set_index('Name')
 
 def replaceTaskDate(parent, child):
     global tasksDf
@@ -64,18 +70,14 @@ def readTaskLns():
     tempDf = pd.DataFrame()
     hasTasks = False
     usedCalcs = []
-    for file in glob.glob('*.csv'):
-        if 'TskLn-' in file:
-            hasTasks = True
-            prelimDf = pd.read_csv(file, sep='|', header=None,
-                                   encoding='unicode_escape')
-            parent = prelimDf.loc[1, 0].split('Task: ')[1]\
-                     .replace(' (Not Parallel)', '').replace(' (Parallel)', '')
-            taskLnDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-            taskIdxs = taskLnDf[taskLnDf['Type']=='TASK'].index.tolist()
-            for child in taskLnDf.loc[taskIdxs, 'Name']:
-                replaceTaskDate(parent, child)
-            tempDf = pd.concat([tempDf,taskLnDf])
+    for meta, taskLnDf in report.taskLines:
+        hasTasks = True
+        parent = meta['Task'].replace(' (Not Parallel)', '')\
+                 .replace(' (Parallel)', '')
+        taskIdxs = taskLnDf[taskLnDf['Type']=='TASK'].index.tolist()
+        for child in taskLnDf.loc[taskIdxs, 'Name']:
+            replaceTaskDate(parent, child)
+        tempDf = pd.concat([tempDf,taskLnDf])
     if hasTasks:
         tempDf.reset_index(inplace=True, drop=True)
         calcIdxs = tempDf[tempDf['Type']=='CALCULATION DEFINITION']\
@@ -96,100 +98,59 @@ def readTaskLns():
 
 def readCalcs():
     global calculationsDf
-    calculationsDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'Calculations_rpt_' not in file: continue
-        calculationsDf = pd.read_csv(file, skiprows=3,
-                                     encoding='unicode_escape')
-        
+    calculationsDf = report.calculations
+
 def readConChecks():
     global conCheckDf
-    conCheckDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if file[:22] != 'Consistency_Checks_rpt': continue
-        conCheckDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-        for r in range(len(conCheckDf.index.tolist())):
-            conCheckDf.loc[r, 'Date Last Used'] = datetime.datetime.strptime(\
-                           conCheckDf.loc[r,'Date Last Used'],
-                           '%d/%m/%Y %H:%M:%S')
-              
+    conCheckDf = report.consistencyChecks
+    if not conCheckDf.empty:
+        conCheckDf['Date Last Used'] = readDates(conCheckDf['Date Last Used'])
+
 def readImports():
     global importsDf
-    importsDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if file[:23] != 'Import_Definitions_rpt_': continue
-        importsDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-        for r in range(len(importsDf.index.tolist())):
-            importsDf.loc[r, 'Date Last Used'] = datetime.datetime.strptime(\
-                           importsDf.loc[r,'Date Last Used'],
-                           '%d/%m/%Y %H:%M:%S')
-            importsDf = importsDf[['Name', 'Description','Date Created',
-                           'Date Last Used']]
-              
+    importsDf = report.imports
+    if not importsDf.empty:
+        importsDf['Date Last Used'] = readDates(importsDf['Date Last Used'])
+        importsDf = importsDf[['Name', 'Description','Date Created',
+                       'Date Last Used']]
+
 def readExports():
     global exportsDf
-    exportsDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if file[:23] != 'Export_Definitions_rpt_': continue
-        exportsDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-        for r in range(len(exportsDf.index.tolist())):
-            exportsDf.loc[r, 'Date Last Used'] = datetime.datetime.strptime(\
-                           exportsDf.loc[r,'Date Last Used'],
-                           '%d/%m/%Y %H:%M:%S')
-            exportsDf = exportsDf[['Name', 'Description','Date Created',
-                           'Date Last Used']]
-        
+    exportsDf = report.exports
+    if not exportsDf.empty:
+        exportsDf['Date Last Used'] = readDates(exportsDf['Date Last Used'])
+        exportsDf = exportsDf[['Name', 'Description','Date Created',
+                       'Date Last Used']]
+
 def readVisualisations():
     global visDf
-    visDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'Visualisations_rpt_' not in file: continue
-        visDf = pd.read_csv(file, skiprows=3,
-                                     encoding='unicode_escape')
-        for r in range(len(visDf.index.tolist())):
-            visDf.loc[r, 'Date Last Used'] = datetime.datetime.strptime(\
-                           visDf.loc[r,'Date Last Used'],'%d/%m/%Y %H:%M:%S')
-            visDf = visDf[['Name', 'Description','Date Created',
-                           'Date Last Used']]
+    visDf = report.visualisations
+    if not visDf.empty:
+        visDf['Date Last Used'] = readDates(visDf['Date Last Used'])
+        visDf = visDf[['Name', 'Description','Date Created',
+                       'Date Last Used']]
 
 def readParams():
     global paramDf
-    paramDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'Parameters_rpt_' not in file: continue
-        paramDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-            
+    paramDf = report.parameters
+
 def readClassGrps():
     global classGrpsDf
-    classGrpDf = pd.DataFrame()
     classGrpsDf = pd.DataFrame(columns=['Name','Description','Classification'])
-    for file in glob.glob('*.csv'):
-        if 'Grps' in file:
-            prelimDf = pd.read_csv(file, sep='|', header=None,
-                                   encoding='unicode_escape')
-            clas = prelimDf.loc[1,0].split('Classification: ')[1]
-            classGrpDf = pd.read_csv(file, skiprows=3, 
-                                     encoding='unicode_escape')
-            classGrpDf.loc[:, 'Classification'] = clas
-            classGrpsDf = pd.concat([classGrpsDf,
-                                     classGrpDf.loc[:, ['Name','Description',
-                                                        'Classification']]])
+    for meta, classGrpDf in report.classGroups:
+        clas = meta['Classification']
+        classGrpDf.loc[:, 'Classification'] = clas
+        classGrpsDf = pd.concat([classGrpsDf,
+                                 classGrpDf.loc[:, ['Name','Description',
+                                                    'Classification']]])
 
 def readExtClass():
     global extClassDf
-    extClassDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'External_Classifications_Out_' in file:
-            extClassDf = pd.read_csv(file, skiprows=4,
-                                     encoding='unicode_escape')
+    extClassDf = report.extClassificationsOut
 
 def readExtDatasets():
     global extDatasetDf
-    extDatasetDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'External_Datasets_Out_' in file:
-            extDatasetDf = pd.read_csv(file, skiprows=3,
-                                     encoding='unicode_escape')
+    extDatasetDf = report.extDatasetsOut
     
 def findRedundantCalcs():
     global redundantCalcs
@@ -255,15 +216,9 @@ def findRedundantParams():
     for typeSpecDet in formulaCalcs['Type Specific Details']:
         formula = typeSpecDet.split('{formula = ')[1]
         formula = formula.split('}')[0]
-        for char in {',','+','-','/',')','(','{','}','*'}:
-            if char in formula:
-                formula = formula.replace(char, ' ')
-        formula = formula.split('$')
-        if len(formula) > 1:
-            for i in range(1, len(formula)):
-                param = formula[i].split(' ')[0].strip()
-                if param in paramDf['Name'].tolist():
-                    paramDf = paramDf[~paramDf['Name'].str.match(param)]
+        for param in ct.formulaParams(formula):
+            if param in paramDf['Name'].tolist():
+                paramDf = paramDf[~paramDf['Name'].str.match(param)]
     redundantParams = paramDf['Name'].tolist()
 
 def getMassiveStr(calcDf=pd.DataFrame(), imDf=pd.DataFrame(),
@@ -301,28 +256,13 @@ def searchClassGrpsDependencies():
             extClassDf.drop(i, inplace=True)
             continue
         if statAct not in grpSrchDf.columns:
-            os.chdir(inpFol)
             fol = configReports.loc[configReports['Statistical Activity']\
                           .isin([statAct]), 'Config Report'].tolist()[0]
-            os.chdir(fol)
-            for file in glob.glob('*.csv'):
-                imDf = pd.DataFrame()
-                exDf = pd.DataFrame()
-                ccDf = pd.DataFrame()
-                if file[:17] == 'Calculations_rpt_':
-                    calcDf = pd.read_csv(file, skiprows=3,
-                                         encoding='unicode_escape')
-                if file[:23] == 'Export_Definitions_rpt_':
-                    exDf = pd.read_csv(file, skiprows=3,
-                                         encoding='unicode_escape')
-                if file[:23] == 'Import_Definitions_rpt_':
-                    imDf = pd.read_csv(file, skiprows=3,
-                                         encoding='unicode_escape')
-                if file[:23] == 'Consistency_Checks_rpt_':
-                    ccDf = pd.read_csv(file, skiprows=3,
-                                         encoding='unicode_escape')
-                massiveStr = getMassiveStr(calcDf=calcDf, imDf=imDf, exDf=exDf,
-                                           ccDf=ccDf)
+            extReport = ct.loadConfigReport(os.path.join(inpFol, fol))
+            massiveStr = getMassiveStr(calcDf=extReport.calculations,
+                                       imDf=extReport.imports,
+                                       exDf=extReport.exports,
+                                       ccDf=extReport.consistencyChecks)
             grpSrchDf.loc[0, statAct] = massiveStr
         else:
             massiveStr = grpSrchDf.loc[0, statAct]
@@ -425,100 +365,85 @@ def formatSheet(sheet, df):
         
 def write():
     global writer
-    filled = False
-    os.chdir(outFolder)
     if len(flaggedTasks)+len(redundantCalcs)+len(redundantParams)\
             +len(flaggedGrps)+len(flaggedVis)+len(redundantConChecks)\
-            +len(redundantImports)+len(redundantExports)>0:
-        writer = pd.ExcelWriter(curStatAct + ' Redundancy Report.xlsx', 
-                            engine='xlsxwriter')
-    if len(flaggedTasks) > 0:
-        filled = True
-        flaggedTaskSheetDf = tasksDf.loc[flaggedTasks].copy()
-        for r, dt in enumerate(flaggedTaskSheetDf['Date Last Used']):
-            flaggedTaskSheetDf.loc[flaggedTaskSheetDf.index[r],
-                                   'Date Last Used']=\
-            datetime.datetime.strftime(dt, '%d/%m/%Y %H:%M:%S')
-        flaggedTaskSheetDf.to_excel(writer, sheet_name='Flagged Tasks')
-        formatSheet('Flagged Tasks', flaggedTaskSheetDf)
-    if len(redundantCalcs) > 0:
-        filled = True
-        redundantCalcSheetDf = calculationsDf.loc[redundantCalcs,
-                                                 ['Description','Date Created',
-                                                  'Date Last Used']].copy()
-        redundantCalcSheetDf.to_excel(writer, sheet_name='Redundant Calcs')
-        formatSheet('Redundant Calcs', redundantCalcSheetDf)
-    if len(redundantParams) > 0:
-        filled = True
-        redundantParamSheetDf = paramDf.copy()
-        redundantParamSheetDf.to_excel(writer,
-                                       sheet_name='Redundant Parameters',
-                                       index=False)
-        formatSheet('Redundant Parameters', redundantParamSheetDf)
-    if len(flaggedGrps) > 0:
-        filled = True
-        flaggedClassGrpDf = classGrpsDf[classGrpsDf['Name'].isin(flaggedGrps)]
-        flaggedClassGrpDf.to_excel(writer,
+            +len(redundantImports)+len(redundantExports) == 0:
+        print(curStatAct + ' has no redundancies!')
+        return
+    with pd.ExcelWriter(os.path.join(outFolder, curStatAct +
+                        ' Redundancy Report.xlsx'),
+                        engine='xlsxwriter') as writer:
+        if len(flaggedTasks) > 0:
+            flaggedTaskSheetDf = tasksDf.loc[flaggedTasks].copy()
+            flaggedTaskSheetDf['Date Last Used'] = \
+                writeDates(flaggedTaskSheetDf['Date Last Used'])
+            flaggedTaskSheetDf.to_excel(writer, sheet_name='Flagged Tasks')
+            formatSheet('Flagged Tasks', flaggedTaskSheetDf)
+        if len(redundantCalcs) > 0:
+            redundantCalcSheetDf = calculationsDf.loc[redundantCalcs,
+                                                      ['Description',
+                                                       'Date Created',
+                                                       'Date Last Used']]\
+                                   .copy()
+            redundantCalcSheetDf.to_excel(writer,
+                                          sheet_name='Redundant Calcs')
+            formatSheet('Redundant Calcs', redundantCalcSheetDf)
+        if len(redundantParams) > 0:
+            redundantParamSheetDf = paramDf.copy()
+            redundantParamSheetDf.to_excel(writer,
+                                           sheet_name='Redundant Parameters',
+                                           index=False)
+            formatSheet('Redundant Parameters', redundantParamSheetDf)
+        if len(flaggedGrps) > 0:
+            flaggedClassGrpDf = classGrpsDf[classGrpsDf['Name']\
+                                            .isin(flaggedGrps)]
+            flaggedClassGrpDf.to_excel(writer,
                                        sheet_name='Flagged Class Groups',
                                        index=False)
-        formatSheet('Flagged Class Groups', flaggedClassGrpDf)
-    if len(flaggedVis) > 0:
-        filled = True
-        flaggedVisSheetDf = visDf.loc[flaggedVis].copy()
-        for r, dt in enumerate(flaggedVisSheetDf['Date Last Used']):
-            flaggedVisSheetDf.loc[flaggedVisSheetDf.index[r],
-                                   'Date Last Used']=\
-            datetime.datetime.strftime(dt, '%d/%m/%Y %H:%M:%S')
-        flaggedVisSheetDf.to_excel(writer, sheet_name='Flagged Visualisations',
-                                   index=False)
-        formatSheet('Flagged Visualisations', flaggedVisSheetDf)
-    if len(redundantConChecks) > 0:
-        filled = True
-        redundantConCheckSheetDf = conCheckDf.loc[redundantConChecks].copy()
-        redundantConCheckSheetDf.reset_index(inplace=True)
-        redundantConCheckSheetDf = redundantConCheckSheetDf[['Name',
-                                                             'Description',
-                                                             'Date Created',
-                                                             'Date Last Used']]
-        for r, dt in enumerate(redundantConCheckSheetDf['Date Last Used']):
-            redundantConCheckSheetDf.loc[redundantConCheckSheetDf.index[r],
-                                   'Date Last Used']=\
-            datetime.datetime.strftime(dt, '%d/%m/%Y %H:%M:%S')
-        redundantConCheckSheetDf.to_excel(writer,
-                                          sheet_name='Redundant Con Checks',
-                                          index=False)
-        formatSheet('Redundant Con Checks', redundantConCheckSheetDf)
-    if len(redundantImports) > 0:
-        filled = True
-        redundantImportsSheetDf = importsDf.loc[redundantImports].copy()
-        redundantImportsSheetDf.reset_index(inplace=True)
-        for r, dt in enumerate(redundantImportsSheetDf['Date Last Used']):
-            redundantImportsSheetDf.loc[redundantImportsSheetDf.index[r],
-                                   'Date Last Used']=\
-            datetime.datetime.strftime(dt, '%d/%m/%Y %H:%M:%S')
-        redundantImportsSheetDf.to_excel(writer,
-                                          sheet_name='Redundant Imports',
-                                          index=False)
-        formatSheet('Redundant Imports', redundantImportsSheetDf)
-    if len(redundantExports) > 0:
-        filled = True
-        redundantExportsSheetDf = exportsDf.loc[redundantExports].copy()
-        redundantExportsSheetDf.reset_index(inplace=True)
-        for r, dt in enumerate(redundantExportsSheetDf['Date Last Used']):
-            redundantExportsSheetDf.loc[redundantExportsSheetDf.index[r],
-                                   'Date Last Used']=\
-            datetime.datetime.strftime(dt, '%d/%m/%Y %H:%M:%S')
-        redundantExportsSheetDf.to_excel(writer,
-                                          sheet_name='Redundant Exports',
-                                          index=False)
-        formatSheet('Redundant Exports', redundantExportsSheetDf)
-    if filled:
+            formatSheet('Flagged Class Groups', flaggedClassGrpDf)
+        if len(flaggedVis) > 0:
+            flaggedVisSheetDf = visDf.loc[flaggedVis].copy()
+            flaggedVisSheetDf['Date Last Used'] = \
+                writeDates(flaggedVisSheetDf['Date Last Used'])
+            flaggedVisSheetDf.to_excel(writer,
+                                       sheet_name='Flagged Visualisations',
+                                       index=False)
+            formatSheet('Flagged Visualisations', flaggedVisSheetDf)
+        if len(redundantConChecks) > 0:
+            redundantConCheckSheetDf = conCheckDf.loc[redundantConChecks]\
+                                       .copy()
+            redundantConCheckSheetDf.reset_index(inplace=True)
+            redundantConCheckSheetDf = redundantConCheckSheetDf[
+                ['Name', 'Description', 'Date Created', 'Date Last Used']]
+            redundantConCheckSheetDf['Date Last Used'] = \
+                writeDates(redundantConCheckSheetDf['Date Last Used'])
+            redundantConCheckSheetDf.to_excel(
+                writer, sheet_name='Redundant Con Checks', index=False)
+            formatSheet('Redundant Con Checks', redundantConCheckSheetDf)
+        if len(redundantImports) > 0:
+            redundantImportsSheetDf = importsDf.loc[redundantImports].copy()
+            redundantImportsSheetDf.reset_index(inplace=True)
+            redundantImportsSheetDf['Date Last Used'] = \
+                writeDates(redundantImportsSheetDf['Date Last Used'])
+            redundantImportsSheetDf.to_excel(writer,
+                                             sheet_name='Redundant Imports',
+                                             index=False)
+            formatSheet('Redundant Imports', redundantImportsSheetDf)
+        if len(redundantExports) > 0:
+            redundantExportsSheetDf = exportsDf.loc[redundantExports].copy()
+            redundantExportsSheetDf.reset_index(inplace=True)
+            redundantExportsSheetDf['Date Last Used'] = \
+                writeDates(redundantExportsSheetDf['Date Last Used'])
+            redundantExportsSheetDf.to_excel(writer,
+                                             sheet_name='Redundant Exports',
+                                             index=False)
+            formatSheet('Redundant Exports', redundantExportsSheetDf)
         print('Saving...')
-        writer.save()
-    else:
-        print(curStatAct + ' has no redundancies!')
 
-def runTask():
+def runTask(inp=None, out=None):
+    """Writes a redundancy report for every Config Report in the INPUT folder
+    inp to the OUTPUT folder out, asking for the folders if not given.
+    """
     global configReports
     global grpSrchDf
     global redundantCalcs
@@ -533,10 +458,16 @@ def runTask():
     global usedGrps
     global usedGrpsExt
     global inpFol, outFolder
+    global report
     grpSrchDf = pd.DataFrame()
-    (inpFol, outFol) = ct.setupFilepaths()
+    if inp is None or out is None:
+        (inp, out) = ct.setupFilepaths()
+    (inpFol, outFol) = (inp, out)
     configReports = ct.unzipConfigReports(inpFol)
     outFolder = ct.createOutFolder(outFol)
+    reports = ct.loadConfigReports([os.path.join(inpFol, rpt) for rpt in
+                                    configReports['Config Report']],
+                                   REPORT_TABLES)
     for i, configRpt in enumerate(configReports['Config Report']):
         curStatAct = configReports.loc[i, 'Statistical Activity']
         print('Writing redundancy report for ' + curStatAct + '...')
@@ -550,8 +481,7 @@ def runTask():
         redundantConChecks = []
         usedGrpsExt = []
         usedGrps = []
-        os.chdir(inpFol)
-        os.chdir(configRpt)
+        report = reports[i]
         readCalcs()
         readVisualisations()
         readConChecks()
@@ -583,8 +513,13 @@ def runTask():
                 searchClassGrpsDependencies()
             compileUsedClassGrps()
         write()
+    ct.closeArchives()
 
 timeTol = datetime.datetime.now() - datetime.timedelta(days=365)
-runTask()
-os.chdir(inpFol)
-ct.done()
\ No newline at end of file
+#Config Report tables read for every Stat Act, parsed in parallel up front
+REPORT_TABLES = ('tasks', 'taskLines', 'calculations', 'consistencyChecks',
+                 'imports', 'exports', 'visualisations', 'parameters',
+                 'classGroups', 'extClassificationsOut', 'extDatasetsOut')
+if __name__ == '__main__':
+    runTask()
+    ct.done()
\ No newline at end of file
@@ -4,8 +4,8 @@ Script to create a specification to renumber the codes of Stat Act Objects
 (Task, calcs, consistency checks).
 """
 
-import pandas as pd, numpy as np, CORDtools as ct
-import glob, os
+import pandas as pd, CORDtools as ct
+import os
 
 def createConcatTaskTree():
     global concatTaskTree
@@ -24,43 +24,49 @@ def readTaskLns():
     children = []
     taskTree = pd.DataFrame()
     objectDf = pd.DataFrame()
-    for file in glob.glob('*.csv'):
-        if 'TskLn-' in file:
-            prelimDf = pd.read_csv(file, sep='|', header=None,
-                                   encoding='unicode_escape')
-            parent = prelimDf.loc[1, 0].split('Task: ')[1]\
-                     .replace(' (Not Parallel)', '').replace(' (Parallel)', '')
-            taskLnDf = pd.read_csv(file, skiprows=3, encoding='unicode_escape')
-            taskTree[parent] = np.nan
-            for r, child in enumerate(taskLnDf['Name']):
-                if child not in objectDf.index:
-                    objectDf.loc[child, 'Type'] = taskLnDf.loc[r, 'Type']
-                children.append(child)
-                taskTree.loc[taskTree[parent].count(), parent] = child
+    for meta, taskLnDf in report.taskLines:
+        parent = meta['Task'].replace(' (Not Parallel)', '')\
+                 .replace(' (Parallel)', '')
+        taskTree[parent] = pd.Series(dtype=object)
+        for r, child in enumerate(taskLnDf['Name']):
+            if child not in objectDf.index:
+                objectDf.loc[child, 'Type'] = taskLnDf.loc[r, 'Type']
+            children.append(child)
+            taskTree.loc[taskTree[parent].count(), parent] = child
 
-def defineTopLevel():
+def addTopLevel(taskName):
+    if taskName in taskTree.columns.tolist():
+        try: 
+            float(taskName.split(' ')[0])
+            topLevels.append(taskName)
+        except:
+            ct.error('Please make sure the top level task has a valid'+
+                  ' numeric code prefix. Unable to use this task as'+
+                  ' top level.', warning=True)
+    else:
+        ct.error('No task with the name "'+taskName+'" exists.',
+              warning=True)
+
+def defineTopLevel(taskNames=None):
+    """Sets the top level tasks to renumber from, asking for them unless
+    they're given as taskNames.
+    """
     global topLevels
+    topLevels = []
+    if taskNames is not None:
+        for taskName in taskNames:
+            addTopLevel(taskName)
+        return
     done = False
     print('Please define which tasks are top level for the Stat Act',
           curStatAct)
     print('When you have finished defining the top level tasks, enter "DONE".')
-    topLevels = []
     while done == False:
         taskName = input('Top Level Task: ')
         if taskName in {'DONE', 'done',''}:
             done = True
         else:
-            if taskName in taskTree.columns.tolist():
-                try: 
-                    float(taskName.split(' ')[0])
-                    topLevels.append(taskName)
-                except:
-                    ct.error('Please make sure the top level task has a valid'+
-                          ' numeric code prefix. Unable to use this task as'+
-                          ' top level.', warning=True)
-            else:
-                ct.error('No task with the name "'+taskName+'" exists.',
-                      warning=True)
+            addTopLevel(taskName)
 
 def stripExistingCode(name):
     hasCode = False
@@ -82,7 +88,7 @@ def addCodes():
     for oldName in codesDf.index:
         newName = codesDf.loc[oldName, 'Code']+' '+stripExistingCode(oldName)
         tempDf = pd.DataFrame({'Old Name':[oldName],'New Name':[newName]})
-        renumberDf = renumberDf.append(tempDf, ignore_index=True)
+        renumberDf = pd.concat([renumberDf, tempDf], ignore_index=True)
 
 def renumber(topLevel):
     global codesDf
@@ -143,41 +149,55 @@ def formatSheet(sheet, df):
 
 def write():
     global writer
-    os.chdir(outFolder)
     print('Writing spec for '+curStatAct+'...')
-    writer = pd.ExcelWriter(curStatAct+' Renumbered.xlsx',
-                            engine='xlsxwriter')
-    renumberDf.to_excel(writer, sheet_name='Specification',
-                         index=False)
-    formatSheet('Specification', renumberDf)
-    writer.save()
+    with pd.ExcelWriter(os.path.join(outFolder,
+                                     curStatAct+' Renumbered.xlsx'),
+                        engine='xlsxwriter') as writer:
+        renumberDf.to_excel(writer, sheet_name='Specification',
+                             index=False)
+        formatSheet('Specification', renumberDf)
 
-def runTask():
+def runTask(inp=None, out=None, topLevelTasks=None):
+    """Writes a renumbering spec for every Config Report in the INPUT folder
+    inp to the OUTPUT folder out, asking for the folders if not given. The
+    top level tasks can be given as topLevelTasks, either a list used for
+    every Stat Act or a dict of lists by Stat Act, otherwise they're asked
+    for.
+    """
     global configReports
     global curStatAct
     global taskRenumberingDf
     global renumberDf
     global codesDf
     global inpFol, outFolder
+    global report
     codesDf = pd.DataFrame(columns=['Code'])
-    (inpFol, outFol) = ct.setupFilepaths()
+    if inp is None or out is None:
+        (inp, out) = ct.setupFilepaths()
+    (inpFol, outFol) = (inp, out)
     configReports = ct.unzipConfigReports(inpFol)
     outFolder = ct.createOutFolder(outFol)
+    reports = ct.loadConfigReports([os.path.join(inpFol, rpt) for rpt in
+                                    configReports['Config Report']],
+                                   ('taskLines',))
     for i, configRpt in enumerate(configReports['Config Report']):
-        renumberDf = pd.DataFrame(columns=['Old Name','New Name'])
-        os.chdir(inpFol)
-        os.chdir(configRpt)
+        renumberDf = pd.DataFrame(columns=['Type','Old Name','New Name'])
+        report = reports[i]
         curStatAct = configReports.loc[i, 'Statistical Activity']
         readTaskLns()
         print()
-        defineTopLevel()
+        if isinstance(topLevelTasks, dict):
+            defineTopLevel(topLevelTasks.get(curStatAct, []))
+        else:
+            defineTopLevel(topLevelTasks)
         print('Renumbering objects for ' + curStatAct + '...')
         for topLevel in topLevels:
             renumber(topLevel)
             addCodes()
         assignObjType()
         write()
-        
-runTask()
-os.chdir(inpFol)
-ct.done()
\ No newline at end of file
+    ct.closeArchives()
+
+if __name__ == '__main__':
+    runTask()
+    ct.done()
\ No newline at end of file
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of how long each CORD Optimisation script takes to start up.
+
+Imports each script in a fresh Python process a number of times and reports
+the median and fastest import time, along with which of the heavy optional
+dependencies (tkinter, matplotlib, networkx, xlsxwriter) the import pulled
+in. Nothing is run, so no folders are needed:
+
+    python startupBenchmark.py [--repeat 5] [--csv startup.csv] [tools...]
+"""
+
+import os, sys, json, subprocess, argparse, statistics
+
+#Times the import of a tool and lists the heavy modules it loaded
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+__import__(sys.argv[1])
+secs = time.perf_counter() - start
+print(json.dumps([secs, [mod for mod in sys.argv[2:] if mod in sys.modules]]))
+'''
+
+def timeImport(tool):
+    """Imports tool in a new Python process, returning the seconds the import
+    took and the HEAVY_MODULES it loaded.
+    """
+    proc = subprocess.run([sys.executable, '-c', PROBE, tool] + HEAVY_MODULES,
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          stdin=subprocess.DEVNULL, universal_newlines=True,
+                          check=True)
+    secs, loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return secs, loaded
+
+def benchmark(tools=None, repeat=5):
+    """Returns a list of (tool, median seconds, fastest seconds, heavy modules
+    loaded) for the startup of each of tools, every script if None.
+    """
+    results = []
+    for tool in tools or TOOLS:
+        times = []
+        for i in range(repeat):
+            secs, loaded = timeImport(tool)
+            times.append(secs)
+        results.append((tool, statistics.median(times), min(times), loaded))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times the startup of the '+
+                                     'CORD Optimisation scripts.')
+    parser.add_argument('tools', nargs='*', help='scripts to time')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='imports to time for each script')
+    parser.add_argument('--csv', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args(argv)
+    results = benchmark(args.tools, args.repeat)
+    print('{:<20} {:>10} {:>10}  {}'.format('Script', 'Median (s)',
+                                            'Fastest (s)', 'Heavy modules'))
+    for tool, median, fastest, loaded in results:
+        print('{:<20} {:>10.3f} {:>10.3f}  {}'.format(tool, median, fastest,
+                                                      ', '.join(loaded)))
+    if args.csv is not None:
+        with open(args.csv, 'w') as f:
+            f.write('Script,Median Seconds,Fastest Seconds,Heavy Modules\n')
+            for tool, median, fastest, loaded in results:
+                f.write(','.join([tool, str(round(median, 4)),
+                                  str(round(fastest, 4)),
+                                  ' '.join(loaded)]) + '\n')
+    return 0
+
+TOOLS = ['CORDtools', 'ImpactTracer', 'redundancyReport',
+         'dependenciesReport', 'renumberObjects', 'compareModes',
+         'compareDatasets', 'CORDbatch']
+HEAVY_MODULES = ['tkinter', 'matplotlib', 'networkx', 'xlsxwriter']
+
+if __name__ == '__main__':
+    sys.exit(main())